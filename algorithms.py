@@ -4,14 +4,16 @@ import math
 import time
 import random
 import multiprocessing
+from isochrone import IsochroneIndex
 from kd_tree import Node, build_kd_tree, find_nearest
+from snap_cache import cached_snap
 
 from utils import *
 
 class T1_Matcher(BaseMatcher):
 
-    def __init__(self):
-        super(T1_Matcher, self).__init__()
+    def __init__(self, event_queue=None):
+        super(T1_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -20,29 +22,28 @@ class T1_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
     
     # Get best driver for a given passenger by finding first availible driver
     def match(self, availible_drivers, passenger_id):
         # Get the first driver availible
-        start_time, driver_id, _, _ = availible_drivers.popleft()
+        driver_id = availible_drivers.popleft()
         # Process driver pick up and drop off; also get whether the driver returns for more rides
         driver_return_to_road = self.complete_ride(driver_id, passenger_id, heuristic="djikstras")
         
         if driver_return_to_road:
             # Re-queue into priority queue with end time of drop off and end position
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                             driver_id,
-                                             self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))
+
+        return driver_id
 
 class T2_Matcher(BaseMatcher):
 
-    def __init__(self):
-        super(T2_Matcher, self).__init__()
+    def __init__(self, event_queue=None):
+        super(T2_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -51,11 +52,10 @@ class T2_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
 
     # Get distance between a node and a coordinate
     def get_euclidean_distance(self, lat1, lon1, lat2, lon2):
@@ -66,29 +66,21 @@ class T2_Matcher(BaseMatcher):
     def match(self, availible_drivers, passenger_id):
 
         # Get the closest available driver by euclidean distance
-        min_distance = float("inf")
-        min_driver = None
-        
-        for i in range(len(availible_drivers)):
-            driver = availible_drivers[i]
-            dist = self.get_euclidean_distance(self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"], driver[2], driver[3])
-            if (dist < min_distance):
-                min_distance = dist
-                min_driver = i
-
-        driver_id = availible_drivers[min_driver][1]
-        del availible_drivers[min_driver]
+        driver_id = self.rank_candidates(availible_drivers, self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon, 1)[0]
+        availible_drivers.remove(driver_id)
         driver_return_to_road = self.complete_ride(driver_id, passenger_id, heuristic="djikstras")
 
         if driver_return_to_road:
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                            driver_id,
-                                            self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))    
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))    
+
+        return driver_id
 
 class T3_Matcher(BaseMatcher):
 
-    def __init__(self):
-        super(T3_Matcher, self).__init__()
+    # With prune, drivers are evaluated by increasing lower bound on their pickup time and the
+    # search stops once no driver left can beat the best one; the match is the same as without
+    def __init__(self, event_queue=None, prune=True):
+        super(T3_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -97,11 +89,13 @@ class T3_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
+        self.prune = prune
+        self.candidates_evaluated = 0
+        self.candidates_pruned = 0
 
     # Get distance between a node and a coordinate
     def get_euclidean_distance(self, lat1, lon1, lat2, lon2):
@@ -119,50 +113,62 @@ class T3_Matcher(BaseMatcher):
         if len(availible_drivers) != 1:
 
             # Find closest nodes to each of driver and passenger
-            passenger_node = self.get_closest_nodes(self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"])
-            for i in range(len(availible_drivers)):
-
-                driver = availible_drivers[i]
-                driver_id = driver[1]
+            passenger_node = self.get_closest_nodes(self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon)
+            candidates = []
+            for position, driver_id in enumerate(availible_drivers):
                 
-                driver_node = self.get_closest_nodes(self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]) if not driver_id in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
+                driver_node = self.get_closest_nodes(self.drivers[driver_id].source_lat, self.drivers[driver_id].source_lon) if not driver_id in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
                 self.nearest_nodes[driver_id] = driver_node
 
                 # Calculate starting drive hour
-                if self.drivers[driver_id]["time"].day < self.passengers[passenger_id]["time"].day:
-                    hour = self.passengers[passenger_id]["time"].hour
-                elif self.drivers[driver_id]["time"].day > self.passengers[passenger_id]["time"].day:
-                    hour = self.drivers[driver_id]["time"].hour
-                else:
-                    hour = max(self.drivers[driver_id]["time"].hour, self.passengers[passenger_id]["time"].hour)
-                
+                hour = hour_of(max(self.drivers[driver_id].time, self.passengers[passenger_id].time))
+                bound = self.map.time_lower_bound(driver_node, passenger_node, hour) if self.prune else 0
+                candidates.append((bound, position, driver_id, driver_node, hour))
+
+            # Most promising drivers first; without pruning every bound is 0 and the pool order is kept
+            candidates.sort()
+            min_position = None
+            for i, (bound, position, driver_id, driver_node, hour) in enumerate(candidates):
+
+                # No driver left can be faster than the best one found
+                if bound > min_time:
+                    self.candidates_pruned += len(candidates) - i
+                    break
+
                 start_time = time.time()
                 pickup_time = self.map.get_time(driver_node, passenger_node, hour, heuristic="djikstras")
                 end_time = time.time()
                 self.get_shortest_path_total_time += (end_time - start_time)
                 self.get_shortest_path_total_calls += 1
+                self.candidates_evaluated += 1
 
-                if (pickup_time < min_time):
+                # Ties go to the driver that comes first in the pool, as when every driver is evaluated in order
+                if pickup_time < min_time or (min_driver is not None and pickup_time == min_time and position < min_position):
                     min_time = pickup_time
-                    min_driver = i
+                    min_driver = driver_id
+                    min_position = position
             
-            driver_id = availible_drivers[min_driver][1]
-            del availible_drivers[min_driver]
+            driver_id = min_driver
+            availible_drivers.remove(driver_id)
             driver_return_to_road = self.complete_ride(driver_id, passenger_id)
         else:
-            driver_id = availible_drivers[0][1]
-            del availible_drivers[0]
+            driver_id = availible_drivers.pop()
             driver_return_to_road = self.complete_ride(driver_id, passenger_id)
         
         if driver_return_to_road:
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                            driver_id,
-                                            self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))
+
+        return driver_id
+
+    def summarize_experiments(self):
+        super(T3_Matcher, self).summarize_experiments()
+        print("Candidates evaluated:", self.candidates_evaluated)
+        print("Candidates pruned by lower bound:", self.candidates_pruned)
 
 class T4_Matcher(BaseMatcher):
 
-    def __init__(self):
-        super(T4_Matcher, self).__init__()
+    def __init__(self, event_queue=None):
+        super(T4_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -171,11 +177,10 @@ class T4_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
         
         # Assuming latlon dictionaries have 'lat' and 'lon' keys
         self.sorted_nodes = sorted(
@@ -185,6 +190,7 @@ class T4_Matcher(BaseMatcher):
         node_coordinates = [((self.map.node_to_latlon[node]['lat'], self.map.node_to_latlon[node]['lon']), node) for node, _ in self.sorted_nodes]
         self.kd_tree = build_kd_tree(node_coordinates)
 
+    @cached_snap
     def get_closest_nodes(self, lat, lon):
         # Start timing current procedure
         start_time = time.time()
@@ -211,52 +217,49 @@ class T4_Matcher(BaseMatcher):
         if len(availible_drivers) != 1:
 
             # Find closest nodes to each of driver and passenger
-            passenger_node = self.get_closest_nodes(self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"])
+            passenger_node = self.get_closest_nodes(self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon)
 
-            for i in range(len(availible_drivers)):
-                
-                driver = availible_drivers[i]
-                driver_id = driver[1]
+            # Every driver is a candidate; in "network" mode the road search out of the passenger's
+            # node finds the closest one directly (see find_candidates)
+            candidates = self.find_candidates(availible_drivers, passenger_id, passenger_node, 1) if self.candidates == "network" else availible_drivers
+
+            for driver_id in candidates:
                 
-                driver_node = self.get_closest_nodes(self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
+                driver_node = self.get_closest_nodes(self.drivers[driver_id].source_lat, self.drivers[driver_id].source_lon) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
                 self.nearest_nodes[driver_id] = driver_node
 
                 # Calculate starting drive hour
-                if self.drivers[driver_id]["time"].day < self.passengers[passenger_id]["time"].day:
-                    hour = self.passengers[passenger_id]["time"].hour
-                elif self.drivers[driver_id]["time"].day > self.passengers[passenger_id]["time"].day:
-                    hour = self.drivers[driver_id]["time"].hour
-                else:
-                    hour = max(self.drivers[driver_id]["time"].hour, self.passengers[passenger_id]["time"].hour)
+                hour = hour_of(max(self.drivers[driver_id].time, self.passengers[passenger_id].time))
                 
                 # Calculate driving time for driver to reach passenger
                 start_time = time.time()
-                pickup_time = self.map.get_time(driver_node, passenger_node, hour)
+                pickup_time = self.get_pickup_time(driver_id, driver_node, passenger_node, hour)
                 end_time = time.time()
                 self.get_shortest_path_total_time += (end_time - start_time)
                 self.get_shortest_path_total_calls += 1
 
                 if (pickup_time < min_time):
                     min_time = pickup_time
-                    min_driver = i
+                    min_driver = driver_id
 
-            driver_id = availible_drivers[min_driver][1]
-            del availible_drivers[min_driver]
+            driver_id = min_driver
+            availible_drivers.remove(driver_id)
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, pickup_time=min_time)
         else:
-            driver_id = availible_drivers[0][1]
-            del availible_drivers[0]
+            driver_id = availible_drivers.pop()
             driver_return_to_road = self.complete_ride(driver_id, passenger_id)
 
         if driver_return_to_road:
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                            driver_id,
-                                            self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))
+
+        return driver_id
 
 class T5_Matcher(BaseMatcher):
 
-    def __init__(self):
-        super(T5_Matcher, self).__init__()
+    # With use_isochrones, candidates are the drivers that can reach the passenger within
+    # 6 minutes by road (from the isochrone index) before falling back to euclidean distance
+    def __init__(self, event_queue=None, use_isochrones=False):
+        super(T5_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -265,18 +268,20 @@ class T5_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
         self.sorted_nodes = sorted(
                     self.map.graph.items(),
                     key=lambda item: (self.map.node_to_latlon[item[0]]['lat'], self.map.node_to_latlon[item[0]]['lon'])
                 )
         node_coordinates = [((self.map.node_to_latlon[node]['lat'], self.map.node_to_latlon[node]['lon']), node) for node, _ in self.sorted_nodes]
         self.kd_tree = build_kd_tree(node_coordinates)
+        if use_isochrones:
+            self.isochrones = IsochroneIndex(self.map)
 
+    @cached_snap
     def get_closest_nodes(self, lat, lon):
         # Start timing current procedure
         start_time = time.time()
@@ -303,40 +308,31 @@ class T5_Matcher(BaseMatcher):
         if len(availible_drivers) != 1:
 
             # Find closest nodes to each of driver and passenger
-            passenger_node = self.get_closest_nodes(self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"])
-            passenger_lat, passenger_lon = self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"]
-
-            # Sort all drivers by euclidean distance to passgner
-            availible_drivers.sort(key=lambda x: self.get_euclidean_distance(
-                                       passenger_lat, passenger_lon,
-                                       self.drivers[x[1]]["source_lat"],
-                                       self.drivers[x[1]]["source_lon"]))
-
-            # Candidate pool; prune all candidates outside the 10 closest by euclidean distance            
-            candidates = [(availible_drivers[i], i) for i in range(min(10, len(availible_drivers)))]
+            passenger_node = self.get_closest_nodes(self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon)
+            # Candidate pool; prune all candidates outside the 10 closest, by road among the drivers
+            # within 6 minutes if there is an isochrone index, otherwise (or if there are none of
+            # those) as find_candidates ranks them
+            closest = None
+            # Pickup times from an earlier passenger's candidate search do not apply here
+            self.candidate_times = dict()
+            if self.isochrones is not None:
+                closest = self.driver_nodes.within(self.isochrones, passenger_node, hour_of(self.passengers[passenger_id].time), 0.1)[:10]
+            if not closest:
+                closest = self.find_candidates(availible_drivers, passenger_id, passenger_node, 10)
             # Prioritize candidates with earlier log-on times
-            candidates.sort(key=lambda x: self.drivers[x[0][1]]["time"])
+            candidates = sorted(closest, key=lambda driver_id: self.drivers[driver_id].time)
 
-            for i in range(len(candidates)):
+            for driver_id in candidates:
                 
-                driver = candidates[i][0]
-                driver_index = candidates[i][1]
-                driver_id = driver[1]
-                
-                driver_node = self.get_closest_nodes(self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
+                driver_node = self.get_closest_nodes(self.drivers[driver_id].source_lat, self.drivers[driver_id].source_lon) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
                 self.nearest_nodes[driver_id] = driver_node
 
                  # Calculate starting drive hour
-                if self.drivers[driver_id]["time"].day < self.passengers[passenger_id]["time"].day:
-                    hour = self.passengers[passenger_id]["time"].hour
-                elif self.drivers[driver_id]["time"].day > self.passengers[passenger_id]["time"].day:
-                    hour = self.drivers[driver_id]["time"].hour
-                else:
-                    hour = max(self.drivers[driver_id]["time"].hour, self.passengers[passenger_id]["time"].hour)
+                hour = hour_of(max(self.drivers[driver_id].time, self.passengers[passenger_id].time))
                 
                 # Calculate driving time for driver to reach passenger
                 start_time = time.time()
-                pickup_time = self.map.get_time(driver_node, passenger_node, hour)
+                pickup_time = self.get_pickup_time(driver_id, driver_node, passenger_node, hour)
                 if (driver_node, passenger_node) not in self.past_times:
                     self.past_times[(driver_node, passenger_node)] = pickup_time
                 end_time = time.time()
@@ -345,22 +341,21 @@ class T5_Matcher(BaseMatcher):
 
                 if (pickup_time < min_time):
                     min_time = pickup_time
-                    min_driver = driver_index
+                    min_driver = driver_id
 
                 # Check to see if we can make a match that gaurantees that the driver can
                 # pick up the passenger in 10 minutes or less
                 if pickup_time <= 0.1:
                     break
 
-            driver_id = availible_drivers[min_driver][1]
-            del availible_drivers[min_driver]
+            driver_id = min_driver
+            availible_drivers.remove(driver_id)
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, pickup_time=min_time, heuristic="manhattan")
         else:
-            driver_id = availible_drivers[0][1]
-            del availible_drivers[0]
+            driver_id = availible_drivers.pop()
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, heuristic="manhattan")
             
         if driver_return_to_road:
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                            driver_id,
-                                            self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))
\ No newline at end of file
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))
+
+        return driver_id
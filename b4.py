@@ -8,106 +8,37 @@ import time
 
 from datetime import datetime
 
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from simulation import Simulation
 
 
+# Contains driver states for simulation
+b4_matcher = B4_Matcher()
+
 # Read the existing JSON file
 with open('past_times.json', 'r') as json_file:
     json_data = json.load(json_file)
 
-# Convert string keys back to tuples, omitting the last element
-converted_data = {tuple(key.strip("()").replace("'", "").split(", ")[:-1]): value for key, value in json_data.items()}
-
-# Print the converted data (optional)
-# print(converted_data)
+# Convert string keys back to tuples of interned node ids, omitting the last element
+# (pairs with a node that is not in the road network can never be looked up, so skip them)
+converted_data = {}
+for key, value in json_data.items():
+    u, v = (b4_matcher.map.node_ids.lookup(node) for node in key.strip("()").replace("'", "").split(", ")[:-1])
+    if u is not None and v is not None:
+        converted_data[(u, v)] = value
 
 # Print the converted data (optional)
 # print(converted_data)
 
-# Contains driver states for simulation
-b4_matcher = B4_Matcher()
 b4_matcher.past_times = converted_data
 b4_matcher.match_counter = 0
 # print(b4_matcher.past_times)
 
-# Priority queue of availible drivers
-availible_drivers = []
-# List of all unmatched passengers by increasing time
-unmatched_passengers = deque([[id, data] for id, data in b4_matcher.passengers.items()])
-# Unmatched at current time
-curr_unmatched_passengers = deque([unmatched_passengers.popleft()])
-# Time of simulation start is the time of the first passenger, since it is sorted by time increasing
-curr_time = curr_unmatched_passengers[0][1]["time"]
-
-# Summary statistics
-plot = []
-start_time = time.time()
-
-# Begin simulation
-while len(unmatched_passengers) > 0 and len(curr_unmatched_passengers) > 0:
-    
-    # Check to see if any new drivers have logged on
-    # Add all drivers availible at current time to the availible drivers priority queue (sorted by increasing time)
-    while b4_matcher.drivers_pq[0][0] <= curr_time:
-        data = heapq.heappop(b4_matcher.drivers_pq)
-        availible_drivers.append((data[0], data[1], data[2], data[3]))
-
-    # Match all availible drivers to customers
-    while len(availible_drivers) > 0 and len(curr_unmatched_passengers) > 0:
-        # Since curr_unmatched_passengers is sorted increasing by time
-        # this will be the longest waiting passenger
-        passenger = curr_unmatched_passengers.popleft()
-        b4_matcher.match(availible_drivers, passenger[0])
-        plot.append((curr_time, b4_matcher.d1, b4_matcher.d2))
-
-    # Set the current time to the next unmatched passenger's log-in time
-    curr_unmatched_passengers.append(unmatched_passengers.popleft())
-
-    if len(unmatched_passengers) > 0:
-        curr_time = unmatched_passengers[0][1]["time"]
-
-    print(len(unmatched_passengers), len(curr_unmatched_passengers), len(availible_drivers))
-    end_time = time.time()
-    execution_time = end_time - start_time
-    print("B4 total runtime:", execution_time)
-    print("Total D1:", b4_matcher.d1)
-    print("Total D2:", b4_matcher.d2)
-    print("Total matches:", b4_matcher.match_counter)
-
+# Replay the passengers against the matcher; with RESUME=1 this continues from the
+# last checkpoint (written every CHECKPOINT_EVERY seconds when that is set)
+simulation = Simulation(b4_matcher, "B4")
+simulation.run()
 
 b4_matcher.summarize_experiments()
 
-# Plotting
-fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True, figsize=(10, 8))
-
-# Summary statistics for desiderata
-plot = sorted(plot)
-x_times = [t[0] for t in plot]
-y_d1 = [t[1] for t in plot]
-y_d2 = [t[2] for t in plot]
-
-ax1.plot(x_times, y_d1, label='D1')
-ax1.set_ylabel('Cumulative passenger time wasted')
-ax2.plot(x_times, y_d2, label='D2')
-ax2.set_ylabel('Cumulative driver time wasted')
-
-# Beautify the x-labels
-ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-ax1.xaxis.set_major_locator(mdates.DayLocator())
-ax1.legend()
-
-ax2.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-ax2.xaxis.set_major_locator(mdates.DayLocator())
-ax2.legend()
-
-fig.autofmt_xdate()
-
-# Labeling and legend
-plt.suptitle('Line Plots with Datetime on X-axis')
-
-# Show the plot
-plt.show()
-
-# 34 seconds for first 200
-# 73.7 seconds for first 500
\ No newline at end of file
+# Per-minute metrics; render them with python report.py b4_metrics.npz
+simulation.metrics.save("b4_metrics.npz")
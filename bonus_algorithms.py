@@ -8,14 +8,16 @@ from datetime import datetime, timedelta
 import time as timer
 import time as timer
 from kd_tree import Node, build_kd_tree, find_nearest
+from snap_cache import cached_snap
+from morton_index import MortonIndex
 
 from utils import *
 
 
 class B1_Matcher(BaseMatcher):
 
-    def __init__(self):
-        super(B1_Matcher, self).__init__()
+    def __init__(self, event_queue=None):
+        super(B1_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -24,11 +26,10 @@ class B1_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
         
         # Assuming latlon dictionaries have 'lat' and 'lon' keys
         self.sorted_nodes = sorted(
@@ -43,6 +44,7 @@ class B1_Matcher(BaseMatcher):
         # Return euclidean norm; assume we are on a locally flat plane
         return math.sqrt((lat1 - lat2) ** 2 + (lon1 - lon2) ** 2)
 
+    @cached_snap
     def get_closest_nodes(self, lat, lon):
         # Start timing current procedure
         start_time = time.time()
@@ -57,26 +59,21 @@ class B1_Matcher(BaseMatcher):
     def complete_ride(self, driver, passenger, driver_node=None, passenger_node=None, pickup_time=None, heuristic="euclidean"):
         
         # Find closest nodes to each of driver and passenger
-        if not driver_node:
-            driver_node = self.get_closest_nodes(self.drivers[driver]["source_lat"], self.drivers[driver]["source_lon"]) if not driver in self.nearest_nodes.keys() else self.nearest_nodes[driver]
-        if not passenger_node:
-            passenger_node = self.get_closest_nodes(self.passengers[passenger]["source_lat"], self.passengers[passenger]["source_lon"])
-        dest_node = self.get_closest_nodes(self.passengers[passenger]["dest_lat"], self.passengers[passenger]["dest_lon"])
+        if driver_node is None:
+            driver_node = self.get_closest_nodes(self.drivers[driver].source_lat, self.drivers[driver].source_lon) if not driver in self.nearest_nodes.keys() else self.nearest_nodes[driver]
+        if passenger_node is None:
+            passenger_node = self.get_closest_nodes(self.passengers[passenger].source_lat, self.passengers[passenger].source_lon)
+        dest_node = self.get_closest_nodes(self.passengers[passenger].dest_lat, self.passengers[passenger].dest_lon)
         
-        # Calculate starting drive hour; note that we check for the day in the case which
-        # a driver logs in at 23h the night before, and the passenger is requesting a ride
-        # the day after at an early time, (say at 0h or 1h)
-        if self.drivers[driver]["time"].day < self.passengers[passenger]["time"].day:
-            hour = self.passengers[passenger]["time"].hour
-        elif self.drivers[driver]["time"].day > self.passengers[passenger]["time"].day:
-            hour = self.drivers[driver]["time"].hour
-        else:
-            hour = max(self.drivers[driver]["time"].hour, self.passengers[passenger]["time"].hour)
+        # Calculate starting drive hour; this is the hour of whichever of the driver and the
+        # passenger is ready last (e.g. a driver who logged in at 23h the night before
+        # picking up a passenger who requested a ride at 0h or 1h drives in hour 0 or 1)
+        hour = hour_of(max(self.drivers[driver].time, self.passengers[passenger].time))
 
         # Calculate driving time for driver to reach passenger
         if not pickup_time:
             start_time = time.time()
-            pickup_time = self.map.get_time(driver_node, passenger_node, hour, heuristic=heuristic)
+            pickup_time = self.map.get_route(driver_node, passenger_node, hour, heuristic=heuristic).time
             end_time = time.time()
             self.get_shortest_path_total_time += (end_time - start_time)
             self.get_shortest_path_total_calls += 1
@@ -85,11 +82,11 @@ class B1_Matcher(BaseMatcher):
                 self.past_times[(driver_node, passenger_node)] = pickup_time
         
         # Time to get to pickup location is start time + time to drive to pickup location
-        new_time = timedelta(hours=pickup_time) + max(self.drivers[driver]["time"], self.passengers[passenger]["time"])
+        new_time = hours_to_seconds(pickup_time) + max(self.drivers[driver].time, self.passengers[passenger].time)
 
         # Calculate driving time from passenger to their destination
         start_time = time.time()
-        driving_time = self.map.get_time(passenger_node, dest_node, hour, heuristic=heuristic)
+        driving_time = self.map.get_route(passenger_node, dest_node, hour, heuristic=heuristic).time
 
         end_time = time.time()
         self.get_shortest_path_total_time += (end_time - start_time)
@@ -100,19 +97,18 @@ class B1_Matcher(BaseMatcher):
         
         # Start time at pickup location + time to drive to arrival location
         # So this is just dropoff time
-        new_time = timedelta(hours=driving_time) + new_time
+        new_time = hours_to_seconds(driving_time) + new_time
 
         # Update the closest node to the driver to the passenger's destination node
         self.nearest_nodes[driver] = dest_node
 
         # Final arrival time - passenger login time
-        self.d1 += ((new_time - self.passengers[passenger]["time"]).total_seconds() / 60)
+        self.d1 += ((new_time - self.passengers[passenger].time) / 60)
         self.d2 += (driving_time - pickup_time) * 60
-        print("D1: ", (new_time - self.passengers[passenger]["time"]).total_seconds() / 60)
-        print("D2: ", (driving_time - pickup_time) * 60)
+        self.log_ride(driver, passenger, driver_node, passenger_node, dest_node, pickup_time, driving_time, new_time)
 
         # Decrement the number of rides the driver has left before they are too exhausted
-        rides = self.drivers[driver]["rides"] - 1
+        rides = self.drivers[driver].rides - 1
         self.total_rides_completed += 1
 
         # Increment the number of rides the driver has completed
@@ -139,34 +135,21 @@ class B1_Matcher(BaseMatcher):
         if len(availible_drivers) != 1:
 
             # Find closest nodes to each of driver and passenger
-            passenger_node = self.get_closest_nodes(self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"])
-            passenger_lat, passenger_lon = self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"]
-
-            # Sort all drivers by euclidean distance to passgner
-            availible_drivers.sort(key=lambda x: self.get_euclidean_distance(
-                                       passenger_lat, passenger_lon,
-                                       self.drivers[x[1]]["source_lat"],
-                                       self.drivers[x[1]]["source_lon"]))
+            passenger_node = self.get_closest_nodes(self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon)
+            # Rank drivers by distance to the passenger (see find_candidates); prune all candidates outside the 10 closest
+            closest = self.find_candidates(availible_drivers, passenger_id, passenger_node, 10)
 
-            for i in range(min(10, len(availible_drivers))):
-                
-                driver = availible_drivers[i]
-                driver_id = driver[1]
+            for driver_id in closest:
                 
-                driver_node = self.get_closest_nodes(self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
+                driver_node = self.get_closest_nodes(self.drivers[driver_id].source_lat, self.drivers[driver_id].source_lon) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
                 self.nearest_nodes[driver_id] = driver_node
 
                  # Calculate starting drive hour
-                if self.drivers[driver_id]["time"].day < self.passengers[passenger_id]["time"].day:
-                    hour = self.passengers[passenger_id]["time"].hour
-                elif self.drivers[driver_id]["time"].day > self.passengers[passenger_id]["time"].day:
-                    hour = self.drivers[driver_id]["time"].hour
-                else:
-                    hour = max(self.drivers[driver_id]["time"].hour, self.passengers[passenger_id]["time"].hour)
+                hour = hour_of(max(self.drivers[driver_id].time, self.passengers[passenger_id].time))
                 
                 # Calculate driving time for driver to reach passenger
                 start_time = time.time()
-                pickup_time = self.map.get_time(driver_node, passenger_node, hour)
+                pickup_time = self.get_pickup_time(driver_id, driver_node, passenger_node, hour)
                 if (driver_node, passenger_node) not in self.past_times:
                     self.past_times[(driver_node, passenger_node)] = pickup_time
                 end_time = time.time()
@@ -175,28 +158,27 @@ class B1_Matcher(BaseMatcher):
 
                 if (pickup_time < min_time):
                     min_time = pickup_time
-                    min_driver = i
+                    min_driver = driver_id
                 
                 if pickup_time <= 0.1:
                     break
 
-            driver_id = availible_drivers[min_driver][1]
-            del availible_drivers[min_driver]
+            driver_id = min_driver
+            availible_drivers.remove(driver_id)
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, pickup_time=min_time, heuristic="manhattan")
         else:
-            driver_id = availible_drivers[0][1]
-            del availible_drivers[0]
+            driver_id = availible_drivers.pop()
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, heuristic="manhattan")
             
         if driver_return_to_road:
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                            driver_id,
-                                            self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))
+
+        return driver_id
 
 
 class B2_Matcher(BaseMatcher):
-    def __init__(self):
-        super(B2_Matcher, self).__init__()
+    def __init__(self, event_queue=None):
+        super(B2_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -205,11 +187,10 @@ class B2_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
         self.sorted_nodes = sorted(
                     self.map.graph.items(),
                     key=lambda item: (self.map.node_to_latlon[item[0]]['lat'], self.map.node_to_latlon[item[0]]['lon'])
@@ -218,6 +199,7 @@ class B2_Matcher(BaseMatcher):
         self.kd_tree = build_kd_tree(node_coordinates)
         self.numDriverRides = {}
 
+    @cached_snap
     def get_closest_nodes(self, lat, lon):
         # Start timing current procedure
         start_time = time.time()
@@ -245,34 +227,21 @@ class B2_Matcher(BaseMatcher):
         if len(availible_drivers) != 1:
 
             # Find closest nodes to each of driver and passenger
-            passenger_node = self.get_closest_nodes(self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"])
-            passenger_lat, passenger_lon = self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"]
+            passenger_node = self.get_closest_nodes(self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon)
+            # Rank drivers by distance to the passenger (see find_candidates); prune all candidates outside the 5 closest
+            closest = self.find_candidates(availible_drivers, passenger_id, passenger_node, 5)
 
-            # Sort all drivers by euclidean distance to passgner
-            availible_drivers.sort(key=lambda x: self.get_euclidean_distance(
-                                       passenger_lat, passenger_lon,
-                                       self.drivers[x[1]]["source_lat"],
-                                       self.drivers[x[1]]["source_lon"]))
-
-            for i in range(min(5, len(availible_drivers))):
-                
-                driver = availible_drivers[i]
-                driver_id = driver[1]
+            for driver_id in closest:
                 
-                driver_node = self.get_closest_nodes(self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
+                driver_node = self.get_closest_nodes(self.drivers[driver_id].source_lat, self.drivers[driver_id].source_lon) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
                 self.nearest_nodes[driver_id] = driver_node
 
                  # Calculate starting drive hour
-                if self.drivers[driver_id]["time"].day < self.passengers[passenger_id]["time"].day:
-                    hour = self.passengers[passenger_id]["time"].hour
-                elif self.drivers[driver_id]["time"].day > self.passengers[passenger_id]["time"].day:
-                    hour = self.drivers[driver_id]["time"].hour
-                else:
-                    hour = max(self.drivers[driver_id]["time"].hour, self.passengers[passenger_id]["time"].hour)
+                hour = hour_of(max(self.drivers[driver_id].time, self.passengers[passenger_id].time))
                 
                 # Calculate driving time for driver to reach passenger
                 start_time = time.time()
-                pickup_time = self.map.get_time(driver_node, passenger_node, hour)
+                pickup_time = self.get_pickup_time(driver_id, driver_node, passenger_node, hour)
                 if (driver_node, passenger_node) not in self.past_times:
                     self.past_times[(driver_node, passenger_node)] = pickup_time
                 end_time = time.time()
@@ -286,31 +255,30 @@ class B2_Matcher(BaseMatcher):
                 if (mod_pickup_time < min_mod_time):
                     min_time = pickup_time
                     min_mod_time = mod_pickup_time
-                    min_driver = i
+                    min_driver = driver_id
                 
                 if pickup_time <= 0.1:
                     break
 
-            driver_id = availible_drivers[min_driver][1]
-            del availible_drivers[min_driver]
+            driver_id = min_driver
+            availible_drivers.remove(driver_id)
             self.numDriverRides[driver_id] = self.numDriverRides.get(driver_id, 0) + 1
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, pickup_time=min_time, heuristic="manhattan")
         else:
-            driver_id = availible_drivers[0][1]
-            del availible_drivers[0]
+            driver_id = availible_drivers.pop()
             self.numDriverRides[driver_id] = self.numDriverRides.get(driver_id, 0) + 1
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, heuristic="manhattan")
             
         if driver_return_to_road:
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                            driver_id,
-                                            self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))
+
+        return driver_id
 
 
 class B2_Default_Matcher(BaseMatcher):
 
-    def __init__(self):
-        super(B2_Default_Matcher, self).__init__()
+    def __init__(self, event_queue=None):
+        super(B2_Default_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -319,11 +287,10 @@ class B2_Default_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
         self.sorted_nodes = sorted(
                     self.map.graph.items(),
                     key=lambda item: (self.map.node_to_latlon[item[0]]['lat'], self.map.node_to_latlon[item[0]]['lon'])
@@ -332,6 +299,7 @@ class B2_Default_Matcher(BaseMatcher):
         self.kd_tree = build_kd_tree(node_coordinates)
         self.numDriverRides = {}
 
+    @cached_snap
     def get_closest_nodes(self, lat, lon):
         # Start timing current procedure
         start_time = time.time()
@@ -358,34 +326,21 @@ class B2_Default_Matcher(BaseMatcher):
         if len(availible_drivers) != 1:
 
             # Find closest nodes to each of driver and passenger
-            passenger_node = self.get_closest_nodes(self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"])
-            passenger_lat, passenger_lon = self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"]
+            passenger_node = self.get_closest_nodes(self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon)
+            # Rank drivers by distance to the passenger (see find_candidates); prune all candidates outside the 10 closest
+            closest = self.find_candidates(availible_drivers, passenger_id, passenger_node, 10)
 
-            # Sort all drivers by euclidean distance to passgner
-            availible_drivers.sort(key=lambda x: self.get_euclidean_distance(
-                                       passenger_lat, passenger_lon,
-                                       self.drivers[x[1]]["source_lat"],
-                                       self.drivers[x[1]]["source_lon"]))
-
-            for i in range(min(10, len(availible_drivers))):
-                
-                driver = availible_drivers[i]
-                driver_id = driver[1]
+            for driver_id in closest:
                 
-                driver_node = self.get_closest_nodes(self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
+                driver_node = self.get_closest_nodes(self.drivers[driver_id].source_lat, self.drivers[driver_id].source_lon) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
                 self.nearest_nodes[driver_id] = driver_node
 
                  # Calculate starting drive hour
-                if self.drivers[driver_id]["time"].day < self.passengers[passenger_id]["time"].day:
-                    hour = self.passengers[passenger_id]["time"].hour
-                elif self.drivers[driver_id]["time"].day > self.passengers[passenger_id]["time"].day:
-                    hour = self.drivers[driver_id]["time"].hour
-                else:
-                    hour = max(self.drivers[driver_id]["time"].hour, self.passengers[passenger_id]["time"].hour)
+                hour = hour_of(max(self.drivers[driver_id].time, self.passengers[passenger_id].time))
                 
                 # Calculate driving time for driver to reach passenger
                 start_time = time.time()
-                pickup_time = self.map.get_time(driver_node, passenger_node, hour)
+                pickup_time = self.get_pickup_time(driver_id, driver_node, passenger_node, hour)
                 if (driver_node, passenger_node) not in self.past_times:
                     self.past_times[(driver_node, passenger_node)] = pickup_time
                 end_time = time.time()
@@ -394,31 +349,30 @@ class B2_Default_Matcher(BaseMatcher):
 
                 if (pickup_time < min_time):
                     min_time = pickup_time
-                    min_driver = i
+                    min_driver = driver_id
                 
                 if pickup_time <= 0.1:
                     break
 
-            driver_id = availible_drivers[min_driver][1]
-            del availible_drivers[min_driver]
+            driver_id = min_driver
+            availible_drivers.remove(driver_id)
             self.numDriverRides[driver_id] = self.numDriverRides.get(driver_id, 0) + 1
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, pickup_time=min_time, heuristic="manhattan")
         else:
-            driver_id = availible_drivers[0][1]
-            del availible_drivers[0]
+            driver_id = availible_drivers.pop()
             self.numDriverRides[driver_id] = self.numDriverRides.get(driver_id, 0) + 1
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, heuristic="manhattan")
             
         if driver_return_to_road:
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                            driver_id,
-                                            self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))
+
+        return driver_id
 
 
 class B3_Matcher(BaseMatcher):
 
-    def __init__(self):
-        super(B3_Matcher, self).__init__()
+    def __init__(self, event_queue=None):
+        super(B3_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -427,11 +381,10 @@ class B3_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
         self.sorted_nodes = sorted(
                     self.map.graph.items(),
                     key=lambda item: (self.map.node_to_latlon[item[0]]['lat'], self.map.node_to_latlon[item[0]]['lon'])
@@ -439,6 +392,7 @@ class B3_Matcher(BaseMatcher):
         node_coordinates = [((self.map.node_to_latlon[node]['lat'], self.map.node_to_latlon[node]['lon']), node) for node, _ in self.sorted_nodes]
         self.kd_tree = build_kd_tree(node_coordinates)
 
+    @cached_snap
     def get_closest_nodes(self, lat, lon):
         # Start timing current procedure
         start_time = time.time()
@@ -462,32 +416,28 @@ class B3_Matcher(BaseMatcher):
         min_driver_node = None
         min_driver = None
 
+        # Drivers whose pickup routes are already behind them no longer add to the traffic
+        self.map.release_traffic(self.passengers[passenger_id].time)
+
         # Minor optimization since if there's only 1 driver availible, then we don't need to check the pickup time
         if len(availible_drivers) != 1:
 
             start_time = time.time()
             # Find closest nodes to each of driver and passenger
-            passenger_node = self.get_closest_nodes(self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"])
+            passenger_node = self.get_closest_nodes(self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon)
             end_time = time.time()
             execution_time = end_time - start_time
             # print(f"PASSENGER CLOSEST Execution time: {execution_time} seconds")
 
-            passenger_lat, passenger_lon = self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"]
-
-            # Sort all drivers by euclidean distance to passgner
-            availible_drivers.sort(key=lambda x: self.get_euclidean_distance(
-                                       passenger_lat, passenger_lon,
-                                       self.drivers[x[1]]["source_lat"],
-                                       self.drivers[x[1]]["source_lon"]))
+            # Rank drivers by distance to the passenger (see find_candidates); prune all candidates outside the 5 closest
+            closest = self.find_candidates(availible_drivers, passenger_id, passenger_node, 5, traffic=True)
 
             execution_time = 0
-            for i in range(min(5, len(availible_drivers))):
+            for driver_id in closest:
                 start_time = time.time()
                 
-                driver = availible_drivers[i]
-                driver_id = driver[1]
                 
-                driver_node = self.get_closest_nodes(self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
+                driver_node = self.get_closest_nodes(self.drivers[driver_id].source_lat, self.drivers[driver_id].source_lon) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
                 self.nearest_nodes[driver_id] = driver_node
 
                 end_time = time.time()
@@ -495,31 +445,29 @@ class B3_Matcher(BaseMatcher):
                 # print(f"DRIVER CLOSEST Execution time: {execution_time} seconds")
 
                 # Calculate starting drive hour
-                if self.drivers[driver_id]["time"].day < self.passengers[passenger_id]["time"].day:
-                    hour = self.passengers[passenger_id]["time"].hour
-                elif self.drivers[driver_id]["time"].day > self.passengers[passenger_id]["time"].day:
-                    hour = self.drivers[driver_id]["time"].hour
-                else:
-                    hour = max(self.drivers[driver_id]["time"].hour, self.passengers[passenger_id]["time"].hour)
+                hour = hour_of(max(self.drivers[driver_id].time, self.passengers[passenger_id].time))
                 # Calculate driving time for driver to reach passenger
-                pickup_time, path = self.map.get_time_with_traffic(driver_node, passenger_node, hour)
-
+                route = self.map.get_route(driver_node, passenger_node, hour, traffic=True)
+                pickup_time = route.time
 
                 if (pickup_time < min_time):
                     min_time = pickup_time
-                    min_driver = i
-                    selected_path = path
+                    min_driver = driver_id
+                    selected_route = route
+                    selected_hour = hour
                     min_driver_node = driver_node
 
                 if pickup_time <= 0.1:
                     break
 
-            # Add Best Path to Traffic
-            self.map.add_traffic(selected_path, hour)
+            # Add Best Path to Traffic until the driver reaches the passenger
+            driver_id = min_driver
+            pickup_at = max(self.drivers[driver_id].time, self.passengers[passenger_id].time) + hours_to_seconds(min_time)
+            self.map.add_traffic(selected_route.edges, selected_hour, pickup_at)
             
             # print(f"AVG DRIVER CLOSEST Execution time: {execution_time/len(availible_drivers)} seconds")
-            driver_id = availible_drivers[min_driver][1]
-            del availible_drivers[min_driver]
+            driver_id = min_driver
+            availible_drivers.remove(driver_id)
 
             start_time = time.time()
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, pickup_time=min_time)
@@ -527,8 +475,7 @@ class B3_Matcher(BaseMatcher):
             execution_time = end_time - start_time
             # print(f"complete_ride Execution time: {execution_time} seconds")
         else:
-            driver_id = availible_drivers[0][1]
-            del availible_drivers[0]
+            driver_id = availible_drivers.pop()
 
             start_time = time.time()
             driver_return_to_road = self.complete_ride(driver_id, passenger_id)
@@ -538,17 +485,17 @@ class B3_Matcher(BaseMatcher):
 
 
         if driver_return_to_road:
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                            driver_id,
-                                            self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))
+
+        return driver_id
 
 
 
 
 class B4_Matcher(BaseMatcher):
 
-    def __init__(self):
-        super(B4_Matcher, self).__init__()
+    def __init__(self, event_queue=None):
+        super(B4_Matcher, self).__init__(event_queue)
         '''
             Create a heap to store all drivers and passengers by time
             Note that the longest waiting passenger is just the passenger
@@ -557,125 +504,85 @@ class B4_Matcher(BaseMatcher):
             join time, we do not need a priority queue for passengers
             (We can simply delete them directly once a ride is fulfilled)
         '''
-        self.drivers_pq = []
+        self.drivers_pq = make_event_queue(self.event_queue)
         for id, data in self.drivers.items():
-            # Insert time first so that heap sorts from min to max time
-            heapq.heappush(self.drivers_pq, (data["time"], id,
-                                             data["source_lat"], data["source_lon"]))
-        
-        self.sorted_nodes = sorted(
-                    self.map.graph.items(),
-                    key=lambda item: (self.map.node_to_latlon[item[0]]['lat'], self.map.node_to_latlon[item[0]]['lon'])
-                )
-        node_coordinates = [(self.map.node_to_latlon[node]['lat'], self.map.node_to_latlon[node]['lon']) for node, _ in self.sorted_nodes]
+            # Insert time first so that the queue sorts from min to max time
+            self.drivers_pq.push((data.time, id))
 
+        # Nodes ordered along a Morton curve for exact nearest node lookups
+        nodes = list(self.map.graph.keys())
+        self.node_index = MortonIndex(nodes,
+                                      [self.map.node_to_latlon[node]['lat'] for node in nodes],
+                                      [self.map.node_to_latlon[node]['lon'] for node in nodes])
+
+        # Number of travel times answered from past_times
+        self.match_counter = 0
 
     def get_euclidean_distance(self, lat1, lon1, lat2, lon2):
         return math.sqrt((lat2 - lat1)**2 + (lon2 - lon1)**2)
 
+    @cached_snap
     def get_closest_nodes(self, lat, lon):
 
         # Start timing current procedure
         start_time = time.time()
 
-        low, high = 0, len(self.sorted_nodes) - 1
-        nearest = None
-        min_distance = float("inf")
-
-        while low <= high:
-            mid = (low + high) // 2
-            current_node, _ = self.sorted_nodes[mid]  # Extracting the node from the tuple
-
-            distance = self.map.get_distance(
-                current_node,
-                lat,
-                lon
-            )
-
-            if distance < min_distance:
-                min_distance = distance
-                nearest = current_node
-
-            if lat < self.map.node_to_latlon[current_node]['lat'] or (
-                lat == self.map.node_to_latlon[current_node]['lat'] and lon < self.map.node_to_latlon[current_node]['lon']
-            ):
-                high = mid - 1
-            else:
-                low = mid + 1
-
-        # Find a 100-neighbor radius for to find a local optima
-        lower_bound = max(0, mid - 50)
-        upper_bound = min(len(self.sorted_nodes), mid + 50)
-        lon_nearest = nearest
-
-        for i in range(lower_bound, upper_bound):
-            current_node, _ = self.sorted_nodes[i]
-            c_dist = self.get_euclidean_distance(lat, lon,
-                                            self.map.node_to_latlon[current_node]["lat"],
-                                            self.map.node_to_latlon[current_node]["lon"])
-            if c_dist < min_distance:
-                min_distance = c_dist
-                lon_nearest = current_node
+        nearest = self.node_index.nearest(lat, lon)
 
         # Compute total time spent finding nearest node
         end_time = time.time()
         self.get_closest_total_time += (end_time - start_time)
         self.get_closest_total_calls += 1
 
-        return lon_nearest
+        return nearest
 
     def complete_ride(self, driver, passenger, driver_node=None, passenger_node=None, pickup_time=None, heuristic="euclidean"):
         
-        if not driver_node and not passenger_node:
+        if driver_node is None and passenger_node is None:
             start_time = time.time()
 
         # Find closest nodes to each of driver and passenger
-        if not driver_node:
-            driver_node = self.get_closest_nodes(self.drivers[driver]["source_lat"], self.drivers[driver]["source_lon"]) if not driver in self.nearest_nodes.keys() else self.nearest_nodes[driver]
-        if not passenger_node:
-            passenger_node = self.get_closest_nodes(self.passengers[passenger]["source_lat"], self.passengers[passenger]["source_lon"])
-        dest_node = self.get_closest_nodes(self.passengers[passenger]["dest_lat"], self.passengers[passenger]["dest_lon"])
+        if driver_node is None:
+            driver_node = self.get_closest_nodes(self.drivers[driver].source_lat, self.drivers[driver].source_lon) if not driver in self.nearest_nodes.keys() else self.nearest_nodes[driver]
+        if passenger_node is None:
+            passenger_node = self.get_closest_nodes(self.passengers[passenger].source_lat, self.passengers[passenger].source_lon)
+        dest_node = self.get_closest_nodes(self.passengers[passenger].dest_lat, self.passengers[passenger].dest_lon)
         
-        if not driver_node and not passenger_node:
+        if driver_node is None and passenger_node is None:
             end_time = time.time()
             execution_time = end_time - start_time
             print(f"CLOSEST Execution time: {execution_time} seconds")
 
-        # Calculate starting drive hour; note that we check for the day in the case which
-        # a driver logs in at 23h the night before, and the passenger is requesting a ride
-        # the day after at an early time, (say at 0h or 1h)
-        if self.drivers[driver]["time"].day < self.passengers[passenger]["time"].day:
-            hour = self.passengers[passenger]["time"].hour
-        elif self.drivers[driver]["time"].day > self.passengers[passenger]["time"].day:
-            hour = self.drivers[driver]["time"].hour
-        else:
-            hour = max(self.drivers[driver]["time"].hour, self.passengers[passenger]["time"].hour)
+        # Calculate starting drive hour; this is the hour of whichever of the driver and the
+        # passenger is ready last (e.g. a driver who logged in at 23h the night before
+        # picking up a passenger who requested a ride at 0h or 1h drives in hour 0 or 1)
+        hour = hour_of(max(self.drivers[driver].time, self.passengers[passenger].time))
 
         # Calculate driving time for driver to reach passenger
         if not pickup_time:
             start_time = time.time()
             if (driver_node, passenger_node) not in self.past_times:
                 pickup_time = self.map.get_time(driver_node, passenger_node, hour, heuristic=heuristic)
-                print("pickup time not matched")
+                self.events.lookup(False, driver_node, passenger_node, "pickup time not matched")
             else:
                 pickup_time = self.past_times[(driver_node, passenger_node)]
-                print("pickup time matched")
+                self.events.lookup(True, driver_node, passenger_node, "pickup time matched")
                 self.match_counter += 1
             end_time = time.time()
             self.get_shortest_path_total_time += (end_time - start_time)
             self.get_shortest_path_total_calls += 1
         
         # Time to get to pickup location is start time + time to drive to pickup location
-        new_time = timedelta(hours=pickup_time) + max(self.drivers[driver]["time"], self.passengers[passenger]["time"])
+        new_time = hours_to_seconds(pickup_time) + max(self.drivers[driver].time, self.passengers[passenger].time)
 
         # Calculate driving time from passenger to their destination
         start_time = time.time()
         if (passenger_node, dest_node) not in self.past_times:
             driving_time = self.map.get_time(passenger_node, dest_node, hour, heuristic=heuristic)
-            print("destination time not matched")
+            self.events.lookup(False, passenger_node, dest_node, "destination time not matched")
         else:
             driving_time = self.past_times[(passenger_node, dest_node)]
-            print("destination time matched")
+            self.events.lookup(True, passenger_node, dest_node, "destination time matched")
             self.match_counter += 1
 
         end_time = time.time()
@@ -684,19 +591,18 @@ class B4_Matcher(BaseMatcher):
         
         # Start time at pickup location + time to drive to arrival location
         # So this is just dropoff time
-        new_time = timedelta(hours=driving_time) + new_time
+        new_time = hours_to_seconds(driving_time) + new_time
 
         # Update the closest node to the driver to the passenger's destination node
         self.nearest_nodes[driver] = dest_node
 
         # Final arrival time - passenger login time
-        self.d1 += ((new_time - self.passengers[passenger]["time"]).total_seconds() / 60)
+        self.d1 += ((new_time - self.passengers[passenger].time) / 60)
         self.d2 += (driving_time - pickup_time) * 60
-        print("D1: ", (new_time - self.passengers[passenger]["time"]).total_seconds() / 60)
-        print("D2: ", (driving_time - pickup_time) * 60)
+        self.log_ride(driver, passenger, driver_node, passenger_node, dest_node, pickup_time, driving_time, new_time)
 
         # Decrement the number of rides the driver has left before they are too exhausted
-        rides = self.drivers[driver]["rides"] - 1
+        rides = self.drivers[driver].rides - 1
         self.total_rides_completed += 1
 
         if rides <= 0:
@@ -718,40 +624,29 @@ class B4_Matcher(BaseMatcher):
         if len(availible_drivers) != 1:
 
             # Find closest nodes to each of driver and passenger
-            passenger_node = self.get_closest_nodes(self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"])
-            passenger_lat, passenger_lon = self.passengers[passenger_id]["source_lat"], self.passengers[passenger_id]["source_lon"]
+            passenger_node = self.get_closest_nodes(self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon)
+            passenger_lat, passenger_lon = self.passengers[passenger_id].source_lat, self.passengers[passenger_id].source_lon
 
-            # Sort all drivers by euclidean distance to passgner
-            availible_drivers.sort(key=lambda x: self.get_euclidean_distance(
-                                       passenger_lat, passenger_lon,
-                                       self.drivers[x[1]]["source_lat"],
-                                       self.drivers[x[1]]["source_lon"]))
+            # Rank drivers by euclidean distance to the passenger; prune all candidates outside the 10 closest
+            closest = self.rank_candidates(availible_drivers, passenger_lat, passenger_lon, 10)
 
-            for i in range(min(10, len(availible_drivers))):
-                
-                driver = availible_drivers[i]
-                driver_id = driver[1]
+            for driver_id in closest:
                 
-                driver_node = self.get_closest_nodes(self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
+                driver_node = self.get_closest_nodes(self.drivers[driver_id].source_lat, self.drivers[driver_id].source_lon) if driver_id not in self.nearest_nodes.keys() else self.nearest_nodes[driver_id]
                 self.nearest_nodes[driver_id] = driver_node
 
                  # Calculate starting drive hour
-                if self.drivers[driver_id]["time"].day < self.passengers[passenger_id]["time"].day:
-                    hour = self.passengers[passenger_id]["time"].hour
-                elif self.drivers[driver_id]["time"].day > self.passengers[passenger_id]["time"].day:
-                    hour = self.drivers[driver_id]["time"].hour
-                else:
-                    hour = max(self.drivers[driver_id]["time"].hour, self.passengers[passenger_id]["time"].hour)
+                hour = hour_of(max(self.drivers[driver_id].time, self.passengers[passenger_id].time))
                 
                 # Calculate driving time for driver to reach passenger
                 start_time = time.time()
                 if (driver_node, passenger_node) in self.past_times:
                     pickup_time = self.past_times[(driver_node, passenger_node)]
-                    print("pickup time matched")
+                    self.events.lookup(True, driver_node, passenger_node, "pickup time matched")
                     self.match_counter += 1
                 else:
                     pickup_time = self.map.get_time(driver_node, passenger_node, hour)
-                    print("pickup time not matched")
+                    self.events.lookup(False, driver_node, passenger_node, "pickup time not matched")
                 # self.past_times[(driver_node, passenger_node, hour)] = pickup_time
                 end_time = time.time()
                 self.get_shortest_path_total_time += (end_time - start_time)
@@ -759,20 +654,19 @@ class B4_Matcher(BaseMatcher):
 
                 if (pickup_time < min_time):
                     min_time = pickup_time
-                    min_driver = i
+                    min_driver = driver_id
                 
                 if pickup_time <= 0.1:
                     break
 
-            driver_id = availible_drivers[min_driver][1]
-            del availible_drivers[min_driver]
+            driver_id = min_driver
+            availible_drivers.remove(driver_id)
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, pickup_time=min_time, heuristic="manhattan")
         else:
-            driver_id = availible_drivers[0][1]
-            del availible_drivers[0]
+            driver_id = availible_drivers.pop()
             driver_return_to_road = self.complete_ride(driver_id, passenger_id, heuristic="manhattan")
             
         if driver_return_to_road:
-            heapq.heappush(self.drivers_pq, (self.drivers[driver_id]["time"],
-                                            driver_id,
-                                            self.drivers[driver_id]["source_lat"], self.drivers[driver_id]["source_lon"]))
\ No newline at end of file
+            self.drivers_pq.push((self.drivers[driver_id].time, driver_id))
+
+        return driver_id
@@ -0,0 +1,253 @@
+import heapq
+import time
+from array import array
+
+INF = float("inf")
+
+class Partition:
+    '''
+        Metric-independent multi-level partition of a RoadNetwork, the first
+        phase of Customizable Route Planning. Nodes are split by recursive
+        geometric bisection (at the median of the wider of the lat/lon extents)
+        until every piece has at most cell_sizes[0] nodes; those are the level 0
+        cells. Level l cells are built the same way with at most cell_sizes[l]
+        nodes by splitting level l + 1 cells, so cells are nested.
+
+        A node is a boundary node of its level l cell if it has an edge to or
+        from another level l cell. Only edge endpoints and cell membership are
+        used, so the partition is built once and reused for every hour and
+        traffic state
+    '''
+
+    def __init__(self, network, cell_sizes=(128, 1024)):
+        self.network = network
+        n = len(network.first_edge) - 1
+        # Levels whose cells would hold the whole graph add nothing
+        self.cell_sizes = [size for size in cell_sizes if size < n] or [max(1, n // 2)]
+        self.levels = len(self.cell_sizes)
+        node_lat, node_lon = network.node_lat, network.node_lon
+
+        # cell[l][u] is the id of the level l cell containing node u
+        self.cell = [array("i", bytes(4 * n)) for _ in range(self.levels)]
+        self.num_cells = [0] * self.levels
+        parents = [list(range(n))]
+        for level in range(self.levels - 1, -1, -1):
+            pieces = []
+            for nodes in parents:
+                pieces.extend(bisect_nodes(nodes, self.cell_sizes[level], node_lat, node_lon))
+            for c, nodes in enumerate(pieces):
+                for u in nodes:
+                    self.cell[level][u] = c
+            self.num_cells[level] = len(pieces)
+            parents = pieces
+
+        # parent[l][c] is the level l + 1 cell containing level l cell c
+        self.parent = [array("i", bytes(4 * self.num_cells[level])) for level in range(self.levels - 1)]
+        for level in range(self.levels - 1):
+            for u in range(n):
+                self.parent[level][self.cell[level][u]] = self.cell[level + 1][u]
+
+        # boundary[l][c] lists the boundary nodes of level l cell c and position[l][u]
+        # is the index of u in its cell's list (-1 if u is not a boundary node)
+        first_edge, edge_head = network.first_edge, network.edge_head
+        self.boundary = []
+        self.position = []
+        for level in range(self.levels):
+            cell = self.cell[level]
+            is_boundary = bytearray(n)
+            for u in range(n):
+                for e in range(first_edge[u], first_edge[u + 1]):
+                    v = edge_head[e]
+                    if cell[u] != cell[v]:
+                        is_boundary[u] = is_boundary[v] = 1
+            boundary = [array("i") for _ in range(self.num_cells[level])]
+            position = array("i", [-1]) * n
+            for u in range(n):
+                if is_boundary[u]:
+                    position[u] = len(boundary[cell[u]])
+                    boundary[cell[u]].append(u)
+            self.boundary.append(boundary)
+            self.position.append(position)
+
+    def num_boundary_nodes(self, level):
+        return sum(len(nodes) for nodes in self.boundary[level])
+
+# Split nodes into pieces of at most limit nodes by repeatedly cutting the widest
+# extent at the median
+def bisect_nodes(nodes, limit, node_lat, node_lon):
+    pieces, stack = [], [nodes]
+    while stack:
+        part = stack.pop()
+        if len(part) <= limit:
+            pieces.append(part)
+            continue
+        lats = [node_lat[u] for u in part]
+        lons = [node_lon[u] for u in part]
+        coordinate = node_lat if max(lats) - min(lats) >= max(lons) - min(lons) else node_lon
+        part = sorted(part, key=coordinate.__getitem__)
+        half = len(part) // 2
+        stack.append(part[half:])
+        stack.append(part[:half])
+    return pieces
+
+class Overlay:
+    '''
+        Metric-dependent overlay over a Partition for one hour, optionally with
+        B3's traffic multipliers: for every cell on every level, the shortest
+        time between each pair of its boundary nodes without leaving the cell,
+        stored as a flat row-major matrix.
+
+        customize() computes the cliques bottom-up: level 0 cliques by Dijkstra
+        on the road edges inside the cell, level l cliques by Dijkstra on the
+        level l - 1 cliques plus the road edges between level l - 1 cells.
+        update(edges) redoes only the cells that contain a changed edge, which is
+        what makes following the traffic cheap. distance() is the multi-level
+        query: from a node whose level l cell holds neither s nor t it only
+        follows that cell's clique and the road edges leaving the cell
+    '''
+
+    def __init__(self, partition, hour, traffic=False):
+        self.partition = partition
+        self.network = partition.network
+        self.hour = hour
+        self.traffic = traffic
+        self.cliques = [[None] * partition.num_cells[level] for level in range(partition.levels)]
+        self.customize_time = 0
+        self.customize()
+
+    # Edge times for the current metric (multiplier is None when there is no traffic)
+    def weights(self):
+        multiplier = self.network.traffic.get_multiplier(self.hour) if self.traffic else None
+        return self.network.edge_time[self.hour], multiplier
+
+    def customize(self):
+        start_time = time.time()
+        for level in range(self.partition.levels):
+            self.customize_cells(level, range(self.partition.num_cells[level]))
+        self.customize_time = time.time() - start_time
+
+    # Recompute the cliques that can depend on the given edges. A cell is redone if
+    # one of the edges joins two of its subcells (or, on level 0, lies inside it) or
+    # if the clique of one of its subcells came out different
+    def update(self, edges):
+        start_time = time.time()
+        partition, edge_head = self.partition, self.network.edge_head
+        dirty = [set() for _ in range(partition.levels)]
+        for e in edges:
+            u, v = self.network.tail_of(e), edge_head[e]
+            for level in range(partition.levels):
+                cell = partition.cell[level]
+                if cell[u] == cell[v]:
+                    # Cells are nested, so the higher levels only see the edge through this one
+                    dirty[level].add(cell[u])
+                    break
+        for level in range(partition.levels):
+            changed = self.customize_cells(level, dirty[level])
+            if level + 1 < partition.levels:
+                dirty[level + 1].update(partition.parent[level][c] for c in changed)
+        self.customize_time = time.time() - start_time
+
+    # Compute the cliques of the given cells; returns the cells whose clique changed
+    def customize_cells(self, level, cells):
+        edge_time, multiplier = self.weights()
+        changed = []
+        for c in cells:
+            nodes = self.partition.boundary[level][c]
+            clique = array("d")
+            for b in nodes:
+                dist = self.cell_search(level, c, b, edge_time, multiplier)
+                clique.extend([dist.get(v, INF) for v in nodes])
+            if clique != self.cliques[level][c]:
+                self.cliques[level][c] = clique
+                changed.append(c)
+        return changed
+
+    # Dijkstra from boundary node b that stays inside level `level` cell c
+    def cell_search(self, level, c, b, edge_time, multiplier):
+        partition, network = self.partition, self.network
+        first_edge, edge_head = network.first_edge, network.edge_head
+        cell = partition.cell[level]
+        lower = level - 1
+        if lower >= 0:
+            lower_cell, lower_position = partition.cell[lower], partition.position[lower]
+            lower_boundary, lower_cliques = partition.boundary[lower], self.cliques[lower]
+
+        # crossed holds the nodes whose best time so far came through a clique. Cliques
+        # are shortest times, so taking the same clique again from there never helps
+        pq, dist, crossed = [(0.0, b)], {b: 0.0}, set()
+        while pq:
+            cost, u = heapq.heappop(pq)
+            if cost > dist[u]:
+                continue
+            if lower >= 0 and u not in crossed:
+                # Shortcut across u's subcell
+                sub = lower_cell[u]
+                nodes, clique = lower_boundary[sub], lower_cliques[sub]
+                row = lower_position[u] * len(nodes)
+                for j in range(len(nodes)):
+                    v = nodes[j]
+                    new_dist = cost + clique[row + j]
+                    if new_dist < dist.get(v, INF):
+                        dist[v] = new_dist
+                        crossed.add(v)
+                        heapq.heappush(pq, (new_dist, v))
+            for e in range(first_edge[u], first_edge[u + 1]):
+                v = edge_head[e]
+                # Road edges that stay in the cell (and, above level 0, cross between subcells)
+                if cell[v] != c or (lower >= 0 and lower_cell[v] == lower_cell[u]):
+                    continue
+                new_dist = cost + (edge_time[e] if multiplier is None else edge_time[e] * multiplier[e])
+                if new_dist < dist.get(v, INF):
+                    dist[v] = new_dist
+                    crossed.discard(v)
+                    heapq.heappush(pq, (new_dist, v))
+        return dist
+
+    # Highest level whose cell containing u holds neither s nor t (-1 if there is none)
+    def query_level(self, u, s, t):
+        for level in range(self.partition.levels - 1, -1, -1):
+            cell = self.partition.cell[level]
+            if cell[u] != cell[s] and cell[u] != cell[t]:
+                return level
+        return -1
+
+    # Shortest travel time from s to t (in hours) under this overlay's metric
+    def distance(self, s, t):
+        partition, network = self.partition, self.network
+        first_edge, edge_head = network.first_edge, network.edge_head
+        edge_time, multiplier = self.weights()
+
+        pq, dist, crossed = [(0.0, s)], {s: 0.0}, set()
+        while pq:
+            cost, u = heapq.heappop(pq)
+            if u == t:
+                return cost
+            if cost > dist[u]:
+                continue
+            level = self.query_level(u, s, t)
+            if level >= 0:
+                cell = partition.cell[level]
+                # u is a boundary node of a cell without s or t: cross the cell in one step
+                # (unless u was itself reached across that cell)
+                if u not in crossed:
+                    c = cell[u]
+                    nodes, clique = partition.boundary[level][c], self.cliques[level][c]
+                    row = partition.position[level][u] * len(nodes)
+                    for j in range(len(nodes)):
+                        v = nodes[j]
+                        new_dist = cost + clique[row + j]
+                        if new_dist < dist.get(v, INF):
+                            dist[v] = new_dist
+                            crossed.add(v)
+                            heapq.heappush(pq, (new_dist, v))
+            for e in range(first_edge[u], first_edge[u + 1]):
+                v = edge_head[e]
+                # Above level -1 only the road edges leaving the cell are needed
+                if level >= 0 and cell[v] == cell[u]:
+                    continue
+                new_dist = cost + (edge_time[e] if multiplier is None else edge_time[e] * multiplier[e])
+                if new_dist < dist.get(v, INF):
+                    dist[v] = new_dist
+                    crossed.discard(v)
+                    heapq.heappush(pq, (new_dist, v))
+        return INF
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+class DriverPool:
+    '''
+        Set of available driver ids with O(1) add and remove.
+
+        By default drivers are kept in the order they became available, so
+        matchers iterate and break ties exactly as they did with a plain list
+        and T1 can take the longest waiting driver with popleft(). With
+        ordered=False drivers are kept in a list with an id -> slot index and
+        removed by swapping the last driver into the freed slot; this is
+        cheaper to iterate but the order changes as drivers leave.
+
+        Listeners (e.g. a spatial index over driver positions) are told about
+        every insert and remove so they stay in sync with the pool
+    '''
+
+    def __init__(self, ordered=True):
+        self.ordered = ordered
+        if ordered:
+            self.drivers = OrderedDict()
+        else:
+            self.drivers = []
+            self.slot = {}
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+        for id in self:
+            listener.insert(id)
+
+    def add(self, id):
+        if self.ordered:
+            self.drivers[id] = None
+        else:
+            self.slot[id] = len(self.drivers)
+            self.drivers.append(id)
+        for listener in self.listeners:
+            listener.insert(id)
+
+    def remove(self, id):
+        if self.ordered:
+            del self.drivers[id]
+        else:
+            # Move the last driver into the removed driver's slot
+            i = self.slot.pop(id)
+            last = self.drivers.pop()
+            if last != id:
+                self.drivers[i] = last
+                self.slot[last] = i
+        for listener in self.listeners:
+            listener.remove(id)
+
+    # Remove and return the most recently added driver (ordered) or any driver (unordered)
+    def pop(self):
+        id = next(reversed(self.drivers)) if self.ordered else self.drivers[-1]
+        self.remove(id)
+        return id
+
+    # Remove and return the driver that has been available the longest (ordered pools only)
+    def popleft(self):
+        id = next(iter(self.drivers))
+        self.remove(id)
+        return id
+
+    # Listeners are derived from the pool (and may hold on to a matcher), so they are not
+    # pickled; whoever restores the pool attaches them again
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["listeners"] = []
+        return state
+
+    def __contains__(self, id):
+        return id in self.drivers if self.ordered else id in self.slot
+
+    def __iter__(self):
+        return iter(self.drivers)
+
+    def __len__(self):
+        return len(self.drivers)
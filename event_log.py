@@ -0,0 +1,152 @@
+import atexit
+import os
+import struct
+import threading
+
+import numpy as np
+
+# Record kinds
+RIDE = 0
+LOOKUP_HIT = 1
+LOOKUP_MISS = 2
+
+# Verbosity levels: what still gets printed to stdout
+QUIET = 0
+PROGRESS = 1    # per-iteration queue sizes and runtime in the driver scripts
+RIDES = 2       # D1 and D2 of every ride
+LOOKUPS = 3     # every past_times lookup in B4
+
+# One fixed-size record per event: kind, passenger id, driver id, request time,
+# pickup time and drop-off time (epoch seconds), driver, passenger and destination
+# nodes, D1 and D2 (minutes). Lookups use driver_node -> passenger_node for the pair
+RECORD = struct.Struct("<Biiqqqiiiff")
+RECORD_DTYPE = np.dtype([
+    ("kind", "u1"), ("passenger", "<i4"), ("driver", "<i4"),
+    ("request_time", "<i8"), ("pickup_time", "<i8"), ("dropoff_time", "<i8"),
+    ("driver_node", "<i4"), ("passenger_node", "<i4"), ("dest_node", "<i4"),
+    ("d1", "<f4"), ("d2", "<f4"),
+])
+
+class EventLog:
+    '''
+        Structured replacement for printing every ride. Events are packed into
+        a fixed-size ring buffer and a background thread appends them to a
+        binary file every `interval` seconds (or sooner once the buffer is half
+        full); if the buffer fills up anyway the writer flushes it itself, so
+        events are never dropped. Without a file, events are only counted.
+
+        Verbosity (default from the VERBOSITY environment variable) controls
+        what is still printed through say()
+    '''
+
+    def __init__(self, path=None, capacity=65536, interval=1.0, verbosity=None):
+        if verbosity is None:
+            verbosity = int(os.environ.get("VERBOSITY", QUIET))
+        self.verbosity = verbosity
+        self.capacity = capacity
+        self.interval = interval
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.head = 0
+        self.pending = 0
+        self.count = 0
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.file = None
+        self.thread = None
+        if path is not None:
+            self.open(path)
+
+    # Start writing events to path. With an offset (from tell() at a checkpoint) the
+    # file is cut back to that point and appended to, for resuming a run
+    def open(self, path, offset=None):
+        self.close()
+        if offset is None:
+            self.file = open(path, "wb")
+        else:
+            self.file = open(path, "r+b")
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        # Flush whatever is left when the interpreter exits
+        atexit.register(self.close)
+
+    def say(self, level, *args):
+        if self.verbosity >= level:
+            print(*args)
+
+    def record(self, kind, passenger=-1, driver=-1, request_time=0, pickup_time=0, dropoff_time=0,
+               driver_node=-1, passenger_node=-1, dest_node=-1, d1=0.0, d2=0.0):
+        self.count += 1
+        if self.file is None:
+            return
+        if self.pending == self.capacity:
+            # The flush thread fell behind; write the buffer out here rather than drop events
+            self.flush()
+        with self.lock:
+            RECORD.pack_into(self.buffer, self.head * RECORD.size, kind, passenger, driver,
+                             int(request_time), int(pickup_time), int(dropoff_time),
+                             driver_node, passenger_node, dest_node, d1, d2)
+            self.head = (self.head + 1) % self.capacity
+            self.pending += 1
+        if self.pending == self.capacity // 2:
+            self.wake.set()
+
+    def ride(self, passenger, driver, request_time, pickup_time, dropoff_time, driver_node, passenger_node, dest_node, d1, d2):
+        self.record(RIDE, passenger, driver, request_time, pickup_time, dropoff_time, driver_node, passenger_node, dest_node, d1, d2)
+
+    # A past_times lookup for the pair (u, v); message is printed at LOOKUPS verbosity
+    def lookup(self, hit, u, v, message=None):
+        self.record(LOOKUP_HIT if hit else LOOKUP_MISS, driver_node=u, passenger_node=v)
+        if message is not None:
+            self.say(LOOKUPS, message)
+
+    # Copy out the pending records (oldest first); must hold the lock
+    def take_pending(self):
+        start = (self.head - self.pending) % self.capacity
+        end = start + self.pending
+        if end <= self.capacity:
+            chunk = bytes(self.buffer[start * RECORD.size:end * RECORD.size])
+        else:
+            chunk = bytes(self.buffer[start * RECORD.size:]) + bytes(self.buffer[:(end - self.capacity) * RECORD.size])
+        self.pending = 0
+        return chunk
+
+    def flush(self):
+        # write_lock keeps chunks in order; the buffer lock is only held while copying
+        # so recording does not wait on the disk
+        with self.write_lock:
+            if self.file is None:
+                return
+            with self.lock:
+                chunk = self.take_pending()
+            self.file.write(chunk)
+            self.file.flush()
+
+    # Flush and return the file position, so a checkpoint can remember where the log was
+    def tell(self):
+        if self.file is None:
+            return None
+        self.flush()
+        return self.file.tell()
+
+    def run(self):
+        while self.file is not None:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        with self.write_lock:
+            file, self.file = self.file, None
+        self.wake.set()
+        self.thread.join()
+        file.close()
+
+# Load a file written by EventLog as a numpy record array
+def read_events(path):
+    return np.fromfile(path, dtype=RECORD_DTYPE)
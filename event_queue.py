@@ -0,0 +1,97 @@
+import heapq
+
+class HeapQueue:
+    '''
+        Binary heap of (time, id) events, the queue the matchers have always used
+    '''
+
+    def __init__(self):
+        self.heap = []
+
+    def push(self, item):
+        heapq.heappush(self.heap, item)
+
+    def pop(self):
+        return heapq.heappop(self.heap)
+
+    def peek(self):
+        return self.heap[0]
+
+    def __len__(self):
+        return len(self.heap)
+
+class CalendarQueue:
+    '''
+        Calendar (bucket) queue of (time, id) events with integer times in seconds.
+        Events go into a ring of buckets, one per `width` seconds (a simulated minute
+        by default), covering `buckets` widths ahead of the front of the queue.
+        Events further ahead wait in a small overflow heap until the ring reaches
+        them, and events earlier than the front go into the front bucket. Only the
+        front bucket is ever sorted, so for dense, nearly monotone times like driver
+        log-ons and drop-offs push and pop are O(1) amortized
+    '''
+
+    def __init__(self, width=60, buckets=1440):
+        self.width = width
+        self.buckets = [[] for _ in range(buckets)]
+        # Absolute bucket number (time // width) at the front of the ring
+        self.current = 0
+        # Whether the front bucket is sorted (largest first, so pop() takes the smallest)
+        self.sorted = False
+        self.overflow = []
+        self.size = 0
+
+    def push(self, item):
+        bucket = item[0] // self.width
+        if self.size == 0:
+            self.current = bucket
+            self.sorted = False
+        bucket = max(bucket, self.current)
+        if bucket >= self.current + len(self.buckets):
+            heapq.heappush(self.overflow, item)
+        else:
+            self.buckets[bucket % len(self.buckets)].append(item)
+            if bucket == self.current:
+                self.sorted = False
+        self.size += 1
+
+    # Move the front of the ring to the first non-empty bucket and sort it
+    def front(self):
+        if self.size == 0:
+            raise IndexError("pop from an empty calendar queue")
+        n = len(self.buckets)
+        bucket = self.buckets[self.current % n]
+        while not bucket:
+            if self.size == len(self.overflow):
+                # Nothing left in the ring, jump straight to the next overflow event
+                self.current = self.overflow[0][0] // self.width
+            else:
+                self.current += 1
+            # Pull in overflow events the ring now reaches
+            while self.overflow and self.overflow[0][0] // self.width < self.current + n:
+                item = heapq.heappop(self.overflow)
+                self.buckets[(item[0] // self.width) % n].append(item)
+            bucket = self.buckets[self.current % n]
+            self.sorted = False
+        if not self.sorted:
+            bucket.sort(reverse=True)
+            self.sorted = True
+        return bucket
+
+    def pop(self):
+        bucket = self.front()
+        self.size -= 1
+        return bucket.pop()
+
+    def peek(self):
+        return self.front()[-1]
+
+    def __len__(self):
+        return self.size
+
+def make_event_queue(kind="heap"):
+    if kind == "heap":
+        return HeapQueue()
+    if kind == "calendar":
+        return CalendarQueue()
+    raise Exception("Unknown event queue: " + kind)
@@ -0,0 +1,79 @@
+import numpy as np
+
+class Driver:
+    # Slots keep each record small and let update_driver change it in place
+    __slots__ = ("time", "rides", "source_lat", "source_lon")
+
+    def __init__(self, time, rides, source_lat, source_lon):
+        self.time = time
+        self.rides = rides
+        self.source_lat = source_lat
+        self.source_lon = source_lon
+
+class Passenger:
+    __slots__ = ("time", "source_lat", "source_lon", "dest_lat", "dest_lon")
+
+    def __init__(self, time, source_lat, source_lon, dest_lat, dest_lon):
+        self.time = time
+        self.source_lat = source_lat
+        self.source_lon = source_lon
+        self.dest_lat = dest_lat
+        self.dest_lon = dest_lon
+
+class Fleet:
+    '''
+        State of every driver, indexed by driver id (ids are handed out in the
+        order drivers are added, starting at 0). Records are updated in place so
+        there is exactly one copy of a driver's time and position; queues and
+        matchers only hold on to driver ids
+    '''
+
+    def __init__(self):
+        self.records = []
+        # Driver coordinates mirrored into numpy arrays (grown by doubling) so that
+        # candidate ranking can compute every distance in one vectorized call
+        self.lat = np.empty(64)
+        self.lon = np.empty(64)
+
+    def add(self, time, rides, lat, lon):
+        id = len(self.records)
+        if id == len(self.lat):
+            self.lat = np.concatenate((self.lat, np.empty(id)))
+            self.lon = np.concatenate((self.lon, np.empty(id)))
+        self.records.append(Driver(time, rides, lat, lon))
+        self.lat[id] = lat
+        self.lon[id] = lon
+        return id
+
+    def update(self, id, time, rides, lat, lon):
+        driver = self.records[id]
+        driver.time = time
+        driver.rides = rides
+        driver.source_lat = lat
+        driver.source_lon = lon
+        self.lat[id] = lat
+        self.lon[id] = lon
+
+    # Positions (into ids) of the k drivers closest to (lat, lon), closest first
+    def rank_by_distance(self, ids, lat, lon, k):
+        distances = (self.lat[ids] - lat) ** 2 + (self.lon[ids] - lon) ** 2
+        if k < len(ids):
+            # Only the k smallest need to be sorted. Ties keep their order in ids, also at
+            # the k-th distance: the earliest of the drivers tied there fill the last places
+            kth = np.partition(distances, k - 1)[k - 1]
+            closer = np.flatnonzero(distances < kth)
+            closest = np.concatenate((closer, np.flatnonzero(distances == kth)[:k - len(closer)]))
+            return closest[np.lexsort((closest, distances[closest]))]
+        return np.argsort(distances, kind="stable")
+
+    def items(self):
+        return enumerate(self.records)
+
+    def __getitem__(self, id):
+        return self.records[id]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
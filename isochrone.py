@@ -0,0 +1,195 @@
+import argparse
+import bisect
+import heapq
+import os
+import time
+from array import array
+
+import numpy as np
+
+INF = float("inf")
+
+class IsochroneIndex:
+    '''
+        For every node p and hour, the nodes a driver can start from and reach
+        p within the largest threshold (3, 6 and 10 minutes by default), with
+        their driving times, as two arrays sorted by time. within(p, hour,
+        threshold) for one of the thresholds is then a bisect: the nodes that
+        reach p within it, closest first.
+
+        Each node's set comes from a bounded Dijkstra over the reverse graph and
+        is computed the first time the node is asked for. build(hour) computes
+        every node of an hour ahead of time and saves the hour to
+        `directory`/hour_<h>.npz (int32 nodes, float32 times in hours and int64
+        offsets per node), which later runs load instead of searching
+    '''
+
+    def __init__(self, network, thresholds=(0.05, 0.1, 1 / 6), directory="isochrones"):
+        self.network = network
+        self.thresholds = sorted(thresholds)
+        self.limit = self.thresholds[-1]
+        self.directory = directory
+        # hour -> {node: (nodes, times)} for lazily searched nodes
+        self.reachable = {}
+        # hour -> (offsets, nodes, times) for hours built or loaded as a whole
+        self.built = {}
+        # Hours whose file has already been looked for
+        self.checked = set()
+
+    def path(self, hour):
+        return os.path.join(self.directory, f"hour_{hour}.npz")
+
+    # Nodes that reach p within the limit in the given hour, sorted by driving time
+    def search(self, p, hour):
+        network = self.network
+        first_reverse, reverse_ids, reverse_tails = network.reverse_edge_list()
+        edge_time = network.edge_time[hour]
+        nodes, times = array("i"), array("f")
+        pq, dist = [(0.0, p)], {p: 0.0}
+        while pq:
+            cost, u = heapq.heappop(pq)
+            if cost > dist[u]:
+                continue
+            nodes.append(u)
+            times.append(cost)
+            for r in range(first_reverse[u], first_reverse[u + 1]):
+                v = reverse_tails[r]
+                new_dist = cost + edge_time[reverse_ids[r]]
+                if new_dist <= self.limit and new_dist < dist.get(v, INF):
+                    dist[v] = new_dist
+                    heapq.heappush(pq, (new_dist, v))
+        return nodes, times
+
+    def get(self, p, hour):
+        if hour not in self.checked:
+            self.checked.add(hour)
+            self.load(hour)
+        if hour in self.built:
+            offsets, nodes, times = self.built[hour]
+            return nodes[offsets[p]:offsets[p + 1]], times[offsets[p]:offsets[p + 1]]
+        reachable = self.reachable.setdefault(hour, {})
+        if p not in reachable:
+            reachable[p] = self.search(p, hour)
+        return reachable[p]
+
+    # (nodes, times) of the nodes that reach p within threshold hours, closest first;
+    # threshold has to be one of the index's thresholds
+    def within(self, p, hour, threshold):
+        if threshold not in self.thresholds:
+            raise Exception(f"Threshold {threshold} is not one of the index thresholds {self.thresholds}")
+        nodes, times = self.get(p, hour)
+        count = bisect.bisect_right(times, threshold)
+        return nodes[:count], times[:count]
+
+    # Search every node of an hour and save the result; returns (seconds, entries, bytes on disk)
+    def build(self, hour):
+        start_time = time.time()
+        n = len(self.network.first_edge) - 1
+        offsets, nodes, times = array("q", [0]), array("i"), array("f")
+        for p in range(n):
+            reached, reached_times = self.search(p, hour)
+            nodes.extend(reached)
+            times.extend(reached_times)
+            offsets.append(len(nodes))
+
+        os.makedirs(self.directory, exist_ok=True)
+        np.savez(self.path(hour), offsets=np.frombuffer(offsets, dtype=np.int64),
+                 nodes=np.frombuffer(nodes, dtype=np.int32), times=np.frombuffer(times, dtype=np.float32),
+                 limit=np.float64(self.limit), hash=np.array(self.network.data_hash()))
+        self.built[hour] = (offsets, nodes, times)
+        self.reachable.pop(hour, None)
+        return time.time() - start_time, len(nodes), os.path.getsize(self.path(hour))
+
+    # Load a saved hour; returns False if there is none or it does not fit this index
+    def load(self, hour):
+        if not os.path.exists(self.path(hour)):
+            return False
+        with np.load(self.path(hour)) as data:
+            if str(data["hash"]) != self.network.data_hash() or float(data["limit"]) < self.limit:
+                return False
+            self.built[hour] = (array("q", data["offsets"].tobytes()), array("i", data["nodes"].tobytes()),
+                                array("f", data["times"].tobytes()))
+        return True
+
+class DriverNodeIndex:
+    '''
+        Available drivers grouped by the node they are snapped to. Register it
+        as a listener on the DriverPool so it follows drivers joining and
+        leaving; within() intersects an isochrone with it to list the drivers
+        who can reach a node within a threshold without running any search
+    '''
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        # node -> {driver id: None}, in the order drivers became available
+        self.drivers_at = {}
+        self.node_of = {}
+
+    def insert(self, id):
+        matcher = self.matcher
+        driver = matcher.drivers[id]
+        node = matcher.nearest_nodes[id] if id in matcher.nearest_nodes else matcher.get_closest_nodes(driver.source_lat, driver.source_lon)
+        matcher.nearest_nodes[id] = node
+        self.node_of[id] = node
+        self.drivers_at.setdefault(node, {})[id] = None
+
+    def remove(self, id):
+        node = self.node_of.pop(id)
+        del self.drivers_at[node][id]
+        if not self.drivers_at[node]:
+            del self.drivers_at[node]
+
+    # Snap an indexed driver again after their position changed
+    def move(self, id):
+        self.remove(id)
+        self.matcher.nearest_nodes.pop(id, None)
+        self.insert(id)
+
+    # The k drivers closest to node p by driving time in the given hour (optionally with
+    # traffic multipliers) as (driver id, time) pairs, closest first. One Dijkstra walks out
+    # from p over the reversed roads and picks up the drivers at each node it settles, so
+    # it stops as soon as k drivers are found (or nothing within limit hours is left)
+    def closest_by_road(self, p, hour, k, multiplier=None, limit=INF):
+        network = self.matcher.map
+        first_reverse, reverse_ids, reverse_tails = network.reverse_edge_list()
+        edge_time = network.edge_time[hour]
+        drivers_at = self.drivers_at
+        found = []
+        pq, dist = [(0.0, p)], {p: 0.0}
+        while pq:
+            cost, u = heapq.heappop(pq)
+            if cost > dist[u]:
+                continue
+            if u in drivers_at:
+                found.extend((id, cost) for id in drivers_at[u])
+                if len(found) >= k:
+                    return found[:k]
+            for r in range(first_reverse[u], first_reverse[u + 1]):
+                v, e = reverse_tails[r], reverse_ids[r]
+                new_dist = cost + (edge_time[e] if multiplier is None else edge_time[e] * multiplier[e])
+                if new_dist <= limit and new_dist < dist.get(v, INF):
+                    dist[v] = new_dist
+                    heapq.heappush(pq, (new_dist, v))
+        return found
+
+    # Driver ids that can reach node p within threshold hours, closest first
+    def within(self, isochrones, p, hour, threshold):
+        nodes, _ = isochrones.within(p, hour, threshold)
+        drivers_at = self.drivers_at
+        return [id for node in nodes if node in drivers_at for id in drivers_at[node]]
+
+if __name__ == "__main__":
+    from utils import RoadNetwork
+
+    parser = argparse.ArgumentParser(description="Build the isochrone index for the given hours and report its cost")
+    parser.add_argument("hours", nargs="+", type=int, help="hours of the day to build")
+    parser.add_argument("--minutes", type=float, default=10, help="largest threshold in minutes")
+    parser.add_argument("--dir", default="isochrones", help="directory to write the index files to")
+    args = parser.parse_args()
+
+    network = RoadNetwork()
+    isochrones = IsochroneIndex(network, (args.minutes / 60,), args.dir)
+    n = len(network.first_edge) - 1
+    for hour in args.hours:
+        seconds, entries, size = isochrones.build(hour)
+        print(f"Hour {hour}: built in {seconds:.1f}s, {entries} entries ({entries / n:.1f} nodes per isochrone), {size / 2 ** 20:.2f} MB")
@@ -0,0 +1,200 @@
+import argparse
+import importlib.util
+import math
+import random
+import time
+from array import array
+
+import numpy as np
+
+INF = float("inf")
+
+HEURISTICS = ("euclidean", "djikstras")
+
+# Numba is optional: it is only imported when a JitSearch is created, and without it the
+# same kernel runs as plain Python
+def numba_available():
+    return importlib.util.find_spec("numba") is not None
+
+# A* from s to t over the compact edge list with one weight per edge, returning the time
+# (inf if t cannot be reached). With euclidean=False there is no heuristic (Dijkstra).
+# The heuristic has to be consistent: nodes are settled once and never reopened.
+# The kernel only uses flat arrays and scalars so Numba can compile it. The binary heap
+# lives in heap_keys/heap_nodes (room for one entry per edge plus the source) and ties on
+# the key go to the smaller node, like heapq's tuples. dist, closed and touched are
+# per-node work arrays; dist has to be all inf and closed all 0 on entry, and the nodes
+# the search touched are reset before returning so the arrays can be reused
+def search_kernel(first_edge, edge_head, weights, node_lat, node_lon, speed_limit, euclidean, s, t,
+                  dist, closed, touched, heap_keys, heap_nodes):
+    t_lat, t_lon = node_lat[t], node_lon[t]
+    dist[s] = 0.0
+    touched[0] = s
+    count = 1
+    heap_keys[0] = 0.0
+    heap_nodes[0] = s
+    size = 1
+    result = INF
+
+    while size > 0:
+        u = heap_nodes[0]
+        # Pop: move the last entry to the root and sift it down
+        size -= 1
+        last_key, last_node = heap_keys[size], heap_nodes[size]
+        i = 0
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and (heap_keys[child + 1] < heap_keys[child] or
+                                     (heap_keys[child + 1] == heap_keys[child] and heap_nodes[child + 1] < heap_nodes[child])):
+                child += 1
+            if heap_keys[child] < last_key or (heap_keys[child] == last_key and heap_nodes[child] < last_node):
+                heap_keys[i] = heap_keys[child]
+                heap_nodes[i] = heap_nodes[child]
+                i = child
+            else:
+                break
+        heap_keys[i] = last_key
+        heap_nodes[i] = last_node
+
+        # Entries left behind by later improvements
+        if closed[u]:
+            continue
+        if u == t:
+            result = dist[u]
+            break
+        closed[u] = 1
+
+        cost = dist[u]
+        for e in range(first_edge[u], first_edge[u + 1]):
+            v = edge_head[e]
+            new_dist = cost + weights[e]
+            if new_dist < dist[v]:
+                if dist[v] == INF:
+                    touched[count] = v
+                    count += 1
+                dist[v] = new_dist
+                if euclidean:
+                    key = new_dist + math.sqrt((t_lat - node_lat[v]) ** 2 + (t_lon - node_lon[v]) ** 2) / speed_limit
+                else:
+                    key = new_dist
+                # Push: sift the new entry up from the end
+                i = size
+                size += 1
+                while i > 0:
+                    parent = (i - 1) // 2
+                    if key < heap_keys[parent] or (key == heap_keys[parent] and v < heap_nodes[parent]):
+                        heap_keys[i] = heap_keys[parent]
+                        heap_nodes[i] = heap_nodes[parent]
+                        i = parent
+                    else:
+                        break
+                heap_keys[i] = key
+                heap_nodes[i] = v
+
+    for i in range(count):
+        u = touched[i]
+        dist[u] = INF
+        closed[u] = 0
+    return result
+
+class JitSearch:
+    '''
+        Point-to-point search backend that runs search_kernel over the
+        network's compact edge list: integer node and edge indices, one weight
+        column per hour. With Numba installed the kernel is compiled with
+        numba.njit on plain numpy views of the network's arrays; otherwise the
+        very same function runs as Python on the arrays themselves, so both
+        give the same times.
+
+        Compiling happens in warm_up(), called from the constructor, and its
+        cost is kept in compile_time instead of landing on the first search.
+        The reference search stays RoadNetwork.get_time; this one is used in
+        its place when the network's search_backend is "jit"
+    '''
+
+    def __init__(self, network):
+        self.network = network
+        n, m = len(network.first_edge) - 1, len(network.edge_head)
+        if numba_available():
+            import numba
+            self.backend = "numba"
+            self.kernel = numba.njit(cache=True)(search_kernel)
+            self.first_edge = np.frombuffer(network.first_edge, dtype=np.int32)
+            self.edge_head = np.frombuffer(network.edge_head, dtype=np.int32)
+            self.node_lat = np.frombuffer(network.node_lat, dtype=np.float64)
+            self.node_lon = np.frombuffer(network.node_lon, dtype=np.float64)
+            self.dist = np.full(n, INF)
+            self.closed = np.zeros(n, dtype=np.uint8)
+            self.touched = np.empty(n, dtype=np.int32)
+            self.heap_keys = np.empty(m + 1, dtype=np.float64)
+            self.heap_nodes = np.empty(m + 1, dtype=np.int32)
+        else:
+            # Plain arrays: indexing single elements is much cheaper than on numpy arrays
+            self.backend = "python"
+            self.kernel = search_kernel
+            self.first_edge, self.edge_head = network.first_edge, network.edge_head
+            self.node_lat, self.node_lon = network.node_lat, network.node_lon
+            self.dist = [INF] * n
+            self.closed = bytearray(n)
+            self.touched = array("i", bytes(4 * n))
+            self.heap_keys = array("d", bytes(8 * (m + 1)))
+            self.heap_nodes = array("i", bytes(4 * (m + 1)))
+        # hour -> weight column in the form the kernel takes
+        self.weights = {}
+        self.compile_time = 0
+        self.warm_up()
+
+    def get_weights(self, hour):
+        if hour not in self.weights:
+            edge_time = self.network.edge_time[hour]
+            if len(edge_time) != len(self.network.edge_head):
+                raise Exception(f"No edge times for hour {hour}")
+            self.weights[hour] = np.frombuffer(edge_time, dtype=np.float64) if self.backend == "numba" else edge_time
+        return self.weights[hour]
+
+    # Run one trivial search so Numba compiles the kernel for these argument types now
+    # rather than on the first real query; returns (and keeps) the seconds it took
+    def warm_up(self):
+        start_time = time.time()
+        if len(self.network.edge_head) > 0:
+            hour = min(self.network.edge_time)
+            self.search(0, 0, hour, True)
+        self.compile_time = time.time() - start_time
+        return self.compile_time
+
+    def search(self, s, t, hour, euclidean):
+        return self.kernel(self.first_edge, self.edge_head, self.get_weights(hour), self.node_lat, self.node_lon,
+                           float(self.network.speed_limit), euclidean, s, t,
+                           self.dist, self.closed, self.touched, self.heap_keys, self.heap_nodes)
+
+    # Shortest time from s to t in the given hour, as RoadNetwork.get_time would return it
+    def get_time(self, s, t, hour, heuristic="euclidean"):
+        if heuristic not in HEURISTICS:
+            raise Exception("The search kernel needs a consistent heuristic, not " + heuristic)
+        return self.search(s, t, hour, heuristic == "euclidean")
+
+if __name__ == "__main__":
+    from utils import RoadNetwork
+
+    parser = argparse.ArgumentParser(description="Time the search kernel against the reference get_time")
+    parser.add_argument("--hour", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=500, help="number of random node pairs")
+    parser.add_argument("--heuristic", default="euclidean", choices=HEURISTICS)
+    args = parser.parse_args()
+
+    network = RoadNetwork()
+    search = JitSearch(network)
+    print(f"Backend: {search.backend}, warm-up {search.compile_time:.3f}s")
+
+    n = len(network.first_edge) - 1
+    pairs = [(random.randrange(n), random.randrange(n)) for _ in range(args.queries)]
+    start_time = time.time()
+    reference = [network.get_time(s, t, args.hour, args.heuristic) for s, t in pairs]
+    reference_time = time.time() - start_time
+    start_time = time.time()
+    times = [search.get_time(s, t, args.hour, args.heuristic) for s, t in pairs]
+    kernel_time = time.time() - start_time
+    error = max((abs(a - b) / max(b, 1e-9) for a, b in zip(times, reference) if a != b), default=0)
+    print(f"get_time: {reference_time / len(pairs) * 1000:.3f}ms per query; kernel: {kernel_time / len(pairs) * 1000:.3f}ms "
+          f"per query ({reference_time / kernel_time:.1f}x faster); max relative difference {error:.1e}")
@@ -1,4 +1,6 @@
 
+import heapq
+
 class Node:
     def __init__(self, point, id, left=None, right=None):
         self.point = point  # The point (x, y)
@@ -21,28 +23,82 @@ def build_kd_tree(points, depth=0):
     node.right = build_kd_tree(sorted_points[median_index + 1:], depth + 1)
     return node
 
+# All of the queries below are exact and iterative. Each stack entry carries a lower
+# bound on the squared distance from the query point to anything in that subtree (the
+# distance to the splitting planes crossed to get there), so a subtree is only visited
+# when it could still hold something closer than what has already been found
+
 def find_nearest(node, point, depth=0, best=None):
-    if node is None:
-        return best
-
-    axis = depth % 2
-    next_best = None
-    next_branch = None
-
-    if best is None or distance_squared(point, node.point) < distance_squared(point, best.point):
-        next_best = node
-    else:
-        next_best = best
-
-    if point[axis] < node.point[axis]:
-        next_branch = find_nearest(node.left, point, depth + 1, next_best)
-    else:
-        next_branch = find_nearest(node.right, point, depth + 1, next_best)
-
-    if next_branch is None or distance_squared(point, next_best.point) < distance_squared(point, next_branch.point):
-        return next_best
-    else:
-        return next_branch
+    best_distance = float("inf") if best is None else distance_squared(point, best.point)
+    stack = [(node, depth, 0)]
+
+    while stack:
+        node, depth, bound = stack.pop()
+        if node is None or bound >= best_distance:
+            continue
+
+        distance = distance_squared(point, node.point)
+        if distance < best_distance:
+            best, best_distance = node, distance
+
+        # Visit the side of the plane the point is on first; the other side is only
+        # worth visiting if the plane is closer than the best point found so far
+        axis = depth % 2
+        diff = point[axis] - node.point[axis]
+        near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+        stack.append((far, depth + 1, max(bound, diff * diff)))
+        stack.append((near, depth + 1, bound))
+
+    return best
+
+# Returns the k nodes closest to point, closest first
+def find_k_nearest(node, point, k, depth=0):
+    if k <= 0:
+        return []
+    # Bounded max-heap of the k best so far, stored as (-distance, tiebreak, node)
+    best = []
+    stack = [(node, depth, 0)]
+
+    while stack:
+        node, depth, bound = stack.pop()
+        if node is None or (len(best) == k and bound >= -best[0][0]):
+            continue
+
+        distance = distance_squared(point, node.point)
+        if len(best) < k:
+            heapq.heappush(best, (-distance, id(node), node))
+        elif distance < -best[0][0]:
+            heapq.heapreplace(best, (-distance, id(node), node))
+
+        axis = depth % 2
+        diff = point[axis] - node.point[axis]
+        near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+        stack.append((far, depth + 1, max(bound, diff * diff)))
+        stack.append((near, depth + 1, bound))
+
+    return [node for _, _, node in sorted(best, key=lambda entry: -entry[0])]
+
+# Returns every node within radius of point (in no particular order)
+def find_within_radius(node, point, radius, depth=0):
+    radius_squared = radius * radius
+    found = []
+    stack = [(node, depth, 0)]
+
+    while stack:
+        node, depth, bound = stack.pop()
+        if node is None or bound > radius_squared:
+            continue
+
+        if distance_squared(point, node.point) <= radius_squared:
+            found.append(node)
+
+        axis = depth % 2
+        diff = point[axis] - node.point[axis]
+        near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+        stack.append((far, depth + 1, max(bound, diff * diff)))
+        stack.append((near, depth + 1, bound))
+
+    return found
 
 def distance_squared(point1, point2):
     return (point1[0] - point2[0]) ** 2 + (point1[1] - point2[1]) ** 2
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from sim_clock import to_epoch
+
+# Load generator for service.py: replays passengers.csv against a running matching
+# service at `speed` times real time and reports how long each ride request took
+# to get its assignment back
+
+def read_requests(path, limit=None):
+    requests = []
+    with open(path, "r") as file:
+        for line in file:
+            if not line.startswith("Date/Time"):
+                data = line.strip().split(",")
+                requests.append({
+                    "type": "ride",
+                    "request": len(requests),
+                    "time": to_epoch(datetime.strptime(data[0], "%m/%d/%Y %H:%M:%S")),
+                    "source_lat": float(data[1]),
+                    "source_lon": float(data[2]),
+                    "dest_lat": float(data[3]),
+                    "dest_lon": float(data[4]),
+                })
+                if limit is not None and len(requests) >= limit:
+                    break
+    return requests
+
+async def receive_replies(reader, sent, latencies, counts, done):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        reply = json.loads(line)
+        counts[reply["type"]] = counts.get(reply["type"], 0) + 1
+        sent_at = sent.pop(reply.get("request"), None)
+        if sent_at is not None:
+            latencies.append(time.perf_counter() - sent_at)
+        if not sent and done.is_set():
+            break
+
+async def replay(requests, host, port, speed, grace):
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    sent = {}
+    latencies = []
+    counts = {}
+    done = asyncio.Event()
+    receiver = asyncio.create_task(receive_replies(reader, sent, latencies, counts, done))
+
+    first_time = requests[0]["time"]
+    start = time.perf_counter()
+    for request in requests:
+        # Sleep until this request is due at `speed` times real time
+        delay = (request["time"] - first_time) / speed - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent[request["request"]] = time.perf_counter()
+        writer.write((json.dumps(request) + "\n").encode())
+        # Waits whenever the service stops reading (backpressure)
+        await writer.drain()
+    replay_time = time.perf_counter() - start
+    done.set()
+
+    # Give the service `grace` seconds to answer the last requests
+    try:
+        await asyncio.wait_for(receiver, grace)
+    except asyncio.TimeoutError:
+        pass
+    writer.close()
+    return latencies, counts, len(sent), replay_time
+
+def report(requests, latencies, counts, unanswered, replay_time):
+    print("Requests sent:", len(requests))
+    print("Replay time:", replay_time, "seconds")
+    print("Throughput:", len(requests) / replay_time, "requests/second")
+    for kind, count in sorted(counts.items()):
+        print("Replies of type " + kind + ":", count)
+    print("Unanswered:", unanswered)
+    if latencies:
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        print("Latency p50:", p50, "ms")
+        print("Latency p95:", p95, "ms")
+        print("Latency p99:", p99, "ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay passengers.csv against service.py and report latency percentiles")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--passengers", default="data/passengers.csv")
+    parser.add_argument("--speed", type=float, default=60.0, help="replay speed as a multiple of real time")
+    parser.add_argument("--limit", type=int, default=None, help="only replay the first LIMIT requests")
+    parser.add_argument("--grace", type=float, default=10.0, help="seconds to wait for replies after the last request")
+    args = parser.parse_args()
+
+    requests = read_requests(args.passengers, args.limit)
+    latencies, counts, unanswered, replay_time = asyncio.run(replay(requests, args.host, args.port, args.speed, args.grace))
+    report(requests, latencies, counts, unanswered, replay_time)
@@ -0,0 +1,102 @@
+import bisect
+from array import array
+
+import numpy as np
+
+class Metrics:
+    '''
+        Time series recorded during a simulation, decimated into bins of
+        bin_seconds (per-minute by default) as they come in: each bin keeps the
+        last value recorded in it and how many samples fell into it, so memory
+        grows with simulated time rather than with the number of rides. With
+        bin_seconds=None every sample is kept.
+
+        Besides series, whole arrays (e.g. rides per driver for B2) can be
+        attached with add_array. save() writes NPZ (everything) or CSV (series,
+        one row per bin); report.py renders either kind of file to images
+    '''
+
+    def __init__(self, bin_seconds=60):
+        self.bin_seconds = bin_seconds
+        # name -> (bin start times, last value, number of samples)
+        self.series = {}
+        self.arrays = {}
+
+    # Record one or more named values at `time` (epoch seconds), e.g.
+    # metrics.record(curr_time, d1=matcher.d1, d2=matcher.d2)
+    def record(self, time, **values):
+        key = time - time % self.bin_seconds if self.bin_seconds else time
+        for name, value in values.items():
+            if name not in self.series:
+                self.series[name] = (array("q"), array("d"), array("i"))
+            times, last, samples = self.series[name]
+            if self.bin_seconds and times and times[-1] == key:
+                last[-1] = value
+                samples[-1] += 1
+            elif not times or times[-1] <= key:
+                times.append(key)
+                last.append(value)
+                samples.append(1)
+            else:
+                # Out of order sample; bins are kept sorted by time
+                i = bisect.bisect_left(times, key)
+                if self.bin_seconds and i < len(times) and times[i] == key:
+                    last[i] = value
+                    samples[i] += 1
+                else:
+                    times.insert(i, key)
+                    last.insert(i, value)
+                    samples.insert(i, 1)
+
+    def add_array(self, name, values):
+        self.arrays[name] = np.asarray(values)
+
+    def get(self, name):
+        times, last, _ = self.series[name]
+        return np.frombuffer(times, dtype=np.int64), np.frombuffer(last, dtype=np.float64)
+
+    def save(self, path):
+        if path.endswith(".npz"):
+            columns = {}
+            for name, (times, last, samples) in self.series.items():
+                columns[name + ".time"] = np.frombuffer(times, dtype=np.int64)
+                columns[name + ".value"] = np.frombuffer(last, dtype=np.float64)
+                columns[name + ".samples"] = np.frombuffer(samples, dtype=np.int32)
+            for name, values in self.arrays.items():
+                columns[name] = values
+            np.savez_compressed(path, **columns)
+        elif path.endswith(".csv"):
+            with open(path, "w") as file:
+                file.write("series,time,value,samples\n")
+                for name, (times, last, samples) in self.series.items():
+                    for i in range(len(times)):
+                        file.write(f"{name},{times[i]},{last[i]!r},{samples[i]}\n")
+        else:
+            raise Exception("Unknown metrics format: " + path)
+
+    @classmethod
+    def load(cls, path):
+        metrics = cls(bin_seconds=None)
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                for key in data.files:
+                    name, _, column = key.rpartition(".")
+                    if column == "time":
+                        metrics.series[name] = (array("q", data[key].tolist()),
+                                                array("d", data[name + ".value"].tolist()),
+                                                array("i", data[name + ".samples"].tolist()))
+                    elif not name:
+                        metrics.arrays[key] = data[key]
+        elif path.endswith(".csv"):
+            with open(path, "r") as file:
+                for line in file:
+                    if not line.startswith("series,"):
+                        name, time, value, samples = line.strip().split(",")
+                        if name not in metrics.series:
+                            metrics.series[name] = (array("q"), array("d"), array("i"))
+                        metrics.series[name][0].append(int(time))
+                        metrics.series[name][1].append(float(value))
+                        metrics.series[name][2].append(int(samples))
+        else:
+            raise Exception("Unknown metrics format: " + path)
+        return metrics
@@ -0,0 +1,108 @@
+
+import bisect
+import math
+import struct
+from array import array
+
+# Coordinates are quantized to BITS bits per axis, so a Morton key fits in 32 bits
+BITS = 16
+MAX_CELL = (1 << BITS) - 1
+
+# Spread the low 16 bits of x out to the even bit positions
+def spread_bits(x):
+    x &= 0xFFFF
+    x = (x | (x << 8)) & 0x00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F
+    x = (x | (x << 2)) & 0x33333333
+    x = (x | (x << 1)) & 0x55555555
+    return x
+
+def morton_key(x, y):
+    return (spread_bits(x) << 1) | spread_bits(y)
+
+class MortonIndex:
+    '''
+        Nearest node lookup over nodes sorted along a Morton (Z-order) curve.
+        Each node gets a 32-bit key from its quantized (lat, lon); keys are kept
+        sorted so lookups are a bisect plus a short scan of nearby keys.
+
+        nearest() is exact: the first scan around the query's position on the
+        curve gives a candidate at distance r, and every node within r of the
+        query lies in the box [lat - r, lat + r] x [lon - r, lon + r]. That box
+        is covered by at most 2 x 2 aligned quadtree cells, and the keys of an
+        aligned cell form one contiguous range, so those ranges are scanned too
+    '''
+
+    def __init__(self, nodes=(), lats=(), lons=(), bounds=None):
+        if bounds is None:
+            bounds = (min(lats), max(lats), min(lons), max(lons))
+        self.min_lat, self.max_lat, self.min_lon, self.max_lon = bounds
+        self.lat_scale = MAX_CELL / max(self.max_lat - self.min_lat, 1e-12)
+        self.lon_scale = MAX_CELL / max(self.max_lon - self.min_lon, 1e-12)
+
+        entries = sorted((self.key(lat, lon), node, lat, lon) for node, lat, lon in zip(nodes, lats, lons))
+        self.keys = array("I", [entry[0] for entry in entries])
+        self.nodes = array("i", [entry[1] for entry in entries])
+        self.lats = array("d", [entry[2] for entry in entries])
+        self.lons = array("d", [entry[3] for entry in entries])
+
+    def quantize(self, lat, lon):
+        x = min(max(int((lat - self.min_lat) * self.lat_scale), 0), MAX_CELL)
+        y = min(max(int((lon - self.min_lon) * self.lon_scale), 0), MAX_CELL)
+        return x, y
+
+    def key(self, lat, lon):
+        return morton_key(*self.quantize(lat, lon))
+
+    # Scan entries lo..hi-1 and return the closest (squared distance, position)
+    def scan(self, lat, lon, lo, hi, best):
+        lats, lons = self.lats, self.lons
+        for i in range(lo, hi):
+            distance = (lats[i] - lat) ** 2 + (lons[i] - lon) ** 2
+            if distance < best[0]:
+                best = (distance, i)
+        return best
+
+    def nearest(self, lat, lon, window=8):
+        n = len(self.keys)
+        if n == 0:
+            return None
+
+        # Candidate from the neighbours along the curve
+        position = bisect.bisect_left(self.keys, self.key(lat, lon))
+        best = self.scan(lat, lon, max(0, position - window), min(n, position + window), (float("inf"), None))
+
+        # Every node closer than the candidate is inside this box
+        r = math.sqrt(best[0])
+        x0, y0 = self.quantize(lat - r, lon - r)
+        x1, y1 = self.quantize(lat + r, lon + r)
+
+        # Smallest aligned cell size that is at least as wide as the box on both
+        # axes, so the box overlaps at most two cells per axis
+        level = max(x1 - x0, y1 - y0).bit_length()
+        size = 1 << (2 * level)
+        for cx in range(x0 >> level, (x1 >> level) + 1):
+            for cy in range(y0 >> level, (y1 >> level) + 1):
+                first_key = morton_key(cx << level, cy << level)
+                lo = bisect.bisect_left(self.keys, first_key)
+                hi = bisect.bisect_left(self.keys, first_key + size, lo)
+                best = self.scan(lat, lon, lo, hi, best)
+
+        return self.nodes[best[1]]
+
+    # Compact on-disk form: the bounds and count followed by the four arrays
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(struct.pack("<4dq", self.min_lat, self.max_lat, self.min_lon, self.max_lon, len(self.keys)))
+            for values in (self.keys, self.nodes, self.lats, self.lons):
+                values.tofile(file)
+
+    @classmethod
+    def load(cls, path):
+        header = struct.Struct("<4dq")
+        with open(path, "rb") as file:
+            *bounds, n = header.unpack(file.read(header.size))
+            index = cls(bounds=tuple(bounds))
+            for values in (index.keys, index.nodes, index.lats, index.lons):
+                values.fromfile(file, n)
+        return index
@@ -0,0 +1,110 @@
+import argparse
+import os
+
+from metrics import Metrics
+from sim_clock import from_epoch
+
+# Render the metrics saved by the simulation scripts (see metrics.Metrics) to image
+# files. matplotlib is only imported here, so simulation and benchmark runs never
+# load it. Usage: python report.py t1_metrics.npz [--out plots] [--format png]
+
+def load_pyplot():
+    import matplotlib
+    # Render straight to files; no window is ever opened
+    matplotlib.use("Agg")
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+    return plt, mdates
+
+def plot_desiderata(metrics, plt, mdates, path):
+    fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True, figsize=(10, 8))
+
+    times, d1 = metrics.get("d1")
+    ax1.plot([from_epoch(t) for t in times.tolist()], d1, label='D1')
+    ax1.set_ylabel('Cumulative passenger time wasted')
+    times, d2 = metrics.get("d2")
+    ax2.plot([from_epoch(t) for t in times.tolist()], d2, label='D2')
+    ax2.set_ylabel('Cumulative driver time wasted')
+
+    # Beautify the x-labels
+    for ax in (ax1, ax2):
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+        ax.xaxis.set_major_locator(mdates.DayLocator())
+        ax.legend()
+    fig.autofmt_xdate()
+
+    fig.savefig(path)
+    plt.close(fig)
+
+def plot_demand(metrics, plt, mdates, path):
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    times, passengers = metrics.get("passengers")
+    ax.plot([from_epoch(t) for t in times.tolist()], passengers, marker='o', linestyle='-', color='blue', label='Passengers')
+    times, drivers = metrics.get("drivers")
+    ax.plot([from_epoch(t) for t in times.tolist()], drivers, marker='s', linestyle='--', color='red', label='Drivers')
+
+    ax.set_xlabel('Time')
+    ax.set_ylabel('# of People')
+    ax.set_title("Passenger Demand and Driver Availibility")
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+    ax.xaxis.set_major_locator(mdates.DayLocator())
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+
+    fig.savefig(path)
+    plt.close(fig)
+
+def plot_equity(metrics, plt, path):
+    # Count drivers by number of rides; the last bin holds everything above 13
+    counts = [0] * 14
+    for value in metrics.arrays["rides_per_driver"]:
+        if 0 <= value <= 13:
+            counts[int(value)] += 1
+        elif value > 13:
+            counts[13] += 1
+
+    fig, ax = plt.subplots()
+    integers = list(range(0, 14))
+    ax.bar(integers, counts)
+    ax.set_xlabel('Number of Rides')
+    ax.set_ylabel('Number of Drivers')
+    ax.set_title('Equality of Rides Assigned to Drivers')
+    ax.set_xticks(integers)
+
+    fig.savefig(path)
+    plt.close(fig)
+
+# Render every plot the metrics file has data for; returns the written paths
+def render(path, out=None, format="png"):
+    metrics = Metrics.load(path)
+    plt, mdates = load_pyplot()
+    prefix = os.path.splitext(os.path.basename(path))[0]
+    if out is None:
+        out = os.path.dirname(path)
+    if out:
+        os.makedirs(out, exist_ok=True)
+
+    written = []
+    if "d1" in metrics.series and "d2" in metrics.series:
+        written.append(os.path.join(out, f"{prefix}_desiderata.{format}"))
+        plot_desiderata(metrics, plt, mdates, written[-1])
+    if "passengers" in metrics.series and "drivers" in metrics.series:
+        written.append(os.path.join(out, f"{prefix}_demand.{format}"))
+        plot_demand(metrics, plt, mdates, written[-1])
+    if "rides_per_driver" in metrics.arrays:
+        written.append(os.path.join(out, f"{prefix}_equity.{format}"))
+        plot_equity(metrics, plt, written[-1])
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render saved simulation metrics to image files")
+    parser.add_argument("metrics", nargs="+", help="metrics files written by the simulation scripts (.npz or .csv)")
+    parser.add_argument("--out", default=None, help="output directory (defaults to next to each metrics file)")
+    parser.add_argument("--format", default="png", help="image format, e.g. png, svg or pdf")
+    args = parser.parse_args()
+
+    for path in args.metrics:
+        for image in render(path, args.out, args.format):
+            print("Wrote", image)
@@ -0,0 +1,72 @@
+import bisect
+from array import array
+from collections import OrderedDict
+
+class Route:
+    '''
+        A driven route through the compact edge list of a RoadNetwork.
+        nodes[i] is a node index, edges[i] is the edge taken from nodes[i] to
+        nodes[i + 1] and offsets[i] is the time (in hours) at which the driver
+        reaches nodes[i], so offsets[0] = 0 and offsets[-1] is the total time
+    '''
+
+    def __init__(self, nodes, edges, offsets):
+        self.nodes = nodes
+        self.edges = edges
+        self.offsets = offsets
+
+    @property
+    def time(self):
+        return self.offsets[-1] if self.offsets else float("inf")
+
+    def __len__(self):
+        return len(self.nodes)
+
+    # Node index the driver is at (or last passed) `elapsed` hours into the route
+    def node_at(self, elapsed):
+        i = bisect.bisect_right(self.offsets, elapsed) - 1
+        return self.nodes[max(i, 0)]
+
+    # Original node IDs, for writing routes out or plotting them
+    def to_node_ids(self, network):
+        return [network.node_ids[u] for u in self.nodes]
+
+# Route returned when t cannot be reached from s
+NO_ROUTE = Route(array("i"), array("i"), array("d"))
+
+class RouteCache:
+    '''
+        Bounded LRU cache of routes keyed by (source node, target node, hour,
+        heuristic), so repeated trips between the same snapped points in the
+        same hour reuse the route instead of running another search. The
+        heuristic is part of the key because an inadmissible one (manhattan)
+        can return a different, slower route
+    '''
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.routes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, s, t, hour, heuristic):
+        key = (s, t, hour, heuristic)
+        route = self.routes.get(key)
+        if route is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.routes.move_to_end(key)
+        return route
+
+    def put(self, s, t, hour, heuristic, route):
+        key = (s, t, hour, heuristic)
+        self.routes[key] = route
+        self.routes.move_to_end(key)
+        if len(self.routes) > self.capacity:
+            # Evict the least recently used route
+            self.routes.popitem(last=False)
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,102 @@
+
+import heapq
+import math
+
+# Maximum number of entries per R-tree node
+NODE_CAPACITY = 16
+
+class RTreeNode:
+    def __init__(self, bbox, children, leaf):
+        self.bbox = bbox          # (min_lat, min_lon, max_lat, max_lon)
+        self.children = children  # Child nodes, or (bbox, u, v, edge) segments for a leaf
+        self.leaf = leaf
+
+def merge_bboxes(bboxes):
+    return (min(b[0] for b in bboxes), min(b[1] for b in bboxes),
+            max(b[2] for b in bboxes), max(b[3] for b in bboxes))
+
+def center(bbox):
+    return ((bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2)
+
+# Sort-Tile-Recursive packing of one level: sort by lat into vertical slices,
+# sort each slice by lon and cut it into runs of NODE_CAPACITY entries
+def pack_level(entries, get_bbox, leaf):
+    n = len(entries)
+    pages = math.ceil(n / NODE_CAPACITY)
+    slice_size = NODE_CAPACITY * math.ceil(math.sqrt(pages))
+    entries = sorted(entries, key=lambda entry: center(get_bbox(entry))[0])
+
+    level = []
+    for i in range(0, n, slice_size):
+        vertical_slice = sorted(entries[i:i + slice_size], key=lambda entry: center(get_bbox(entry))[1])
+        for j in range(0, len(vertical_slice), NODE_CAPACITY):
+            children = vertical_slice[j:j + NODE_CAPACITY]
+            level.append(RTreeNode(merge_bboxes([get_bbox(child) for child in children]), children, leaf))
+    return level
+
+def build_rtree(segments):
+    if not segments:
+        return None
+    level = pack_level(segments, lambda segment: segment[0], True)
+    while len(level) > 1:
+        level = pack_level(level, lambda node: node.bbox, False)
+    return level[0]
+
+# Squared distance from a point to a bounding box (0 if the point is inside)
+def bbox_distance_squared(lat, lon, bbox):
+    d_lat = max(bbox[0] - lat, 0, lat - bbox[2])
+    d_lon = max(bbox[1] - lon, 0, lon - bbox[3])
+    return d_lat * d_lat + d_lon * d_lon
+
+# Squared distance from a point to segment AB and how far along AB (0..1) the closest point is
+def project_onto_segment(lat, lon, a_lat, a_lon, b_lat, b_lon):
+    d_lat, d_lon = b_lat - a_lat, b_lon - a_lon
+    length_squared = d_lat * d_lat + d_lon * d_lon
+    fraction = 0.0
+    if length_squared > 0:
+        fraction = min(max(((lat - a_lat) * d_lat + (lon - a_lon) * d_lon) / length_squared, 0.0), 1.0)
+    p_lat, p_lon = a_lat + fraction * d_lat, a_lon + fraction * d_lon
+    return (lat - p_lat) ** 2 + (lon - p_lon) ** 2, fraction
+
+class EdgeRTree:
+    '''
+        STR bulk-loaded R-tree over the road segments of a RoadNetwork, used to
+        snap a coordinate onto the closest point of the closest road instead of
+        the closest intersection
+    '''
+
+    def __init__(self, network):
+        self.network = network
+        node_lat, node_lon = network.node_lat, network.node_lon
+        segments = []
+        for u in range(len(network.first_edge) - 1):
+            for e in range(network.first_edge[u], network.first_edge[u + 1]):
+                v = network.edge_head[e]
+                bbox = (min(node_lat[u], node_lat[v]), min(node_lon[u], node_lon[v]),
+                        max(node_lat[u], node_lat[v]), max(node_lon[u], node_lon[v]))
+                segments.append((bbox, u, v, e))
+        self.root = build_rtree(segments)
+
+    # Returns (edge, fraction along the edge, distance) for the segment closest to (lat, lon)
+    def nearest(self, lat, lon):
+        if self.root is None:
+            return None
+        node_lat, node_lon = self.network.node_lat, self.network.node_lon
+
+        # Best-first search: tree nodes are keyed by the distance to their bounding box and
+        # segments by their exact distance, so the first segment popped is the closest one
+        counter = 0
+        pq = [(bbox_distance_squared(lat, lon, self.root.bbox), counter, self.root, None)]
+        while pq:
+            distance, _, node, fraction = heapq.heappop(pq)
+            if not isinstance(node, RTreeNode):
+                return node, fraction, math.sqrt(distance)
+            for child in node.children:
+                counter += 1
+                if node.leaf:
+                    _, u, v, e = child
+                    child_distance, child_fraction = project_onto_segment(lat, lon, node_lat[u], node_lon[u], node_lat[v], node_lon[v])
+                    heapq.heappush(pq, (child_distance, counter, e, child_fraction))
+                else:
+                    heapq.heappush(pq, (bbox_distance_squared(lat, lon, child.bbox), counter, child, None))
+        return None
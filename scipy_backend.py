@@ -0,0 +1,123 @@
+import argparse
+import importlib.util
+import json
+import random
+import time
+
+import numpy as np
+
+# SciPy is optional: it is only imported when a backend is created, so the simulation
+# runs without it
+def scipy_available():
+    return importlib.util.find_spec("scipy") is not None
+
+class ScipyBackend:
+    '''
+        Bulk shortest paths with scipy.sparse.csgraph for offline work such as
+        travel time matrices and past_times tables. Each hour's edge times (the
+        arrays RoadNetwork exports from edge_data, in the same compact edge
+        order) become an n x n csr_matrix, built the first time the hour is used
+        and cached. csgraph.dijkstra then runs from batches of batch_size source
+        nodes at a time, optionally cut off at `limit` hours.
+
+        Rows and columns are the network's interned node indices; node_ids maps
+        them back to the IDs used in the data files
+    '''
+
+    def __init__(self, network, batch_size=256):
+        try:
+            import scipy.sparse
+            from scipy.sparse import csgraph
+        except ImportError:
+            raise Exception("The SciPy backend needs scipy; install it with pip install scipy")
+        self.sparse, self.csgraph = scipy.sparse, csgraph
+        self.network = network
+        self.batch_size = batch_size
+        # hour -> csr_matrix of edge times, and its transpose for searches towards targets
+        self.matrices = {}
+        self.transposed = {}
+
+    def matrix(self, hour, transpose=False):
+        if hour not in self.matrices:
+            network = self.network
+            n = len(network.first_edge) - 1
+            edge_time = network.edge_time[hour]
+            if len(edge_time) != len(network.edge_head):
+                raise Exception(f"No edge times for hour {hour}")
+            # Explicit zeros stay edges of weight 0, and csgraph keeps the cheapest of parallel edges
+            self.matrices[hour] = self.sparse.csr_matrix(
+                (np.frombuffer(edge_time, dtype=np.float64), np.frombuffer(network.edge_head, dtype=np.int32),
+                 np.frombuffer(network.first_edge, dtype=np.int32)), shape=(n, n))
+        if not transpose:
+            return self.matrices[hour]
+        if hour not in self.transposed:
+            self.transposed[hour] = self.matrices[hour].T.tocsr()
+        return self.transposed[hour]
+
+    # Times from each source to every node, shape (len(sources), n); inf where a node is
+    # unreachable or further than limit hours. With transpose=True the times are to the
+    # sources instead
+    def distances(self, sources, hour, limit=None, transpose=False):
+        matrix = self.matrix(hour, transpose)
+        sources = np.asarray(sources, dtype=np.int32)
+        rows = []
+        for i in range(0, len(sources), self.batch_size):
+            rows.append(self.csgraph.dijkstra(matrix, directed=True, indices=sources[i:i + self.batch_size],
+                                              limit=np.inf if limit is None else limit))
+        return np.vstack(rows) if rows else np.empty((0, matrix.shape[0]))
+
+    # Dense float32 matrix of times from sources to targets, searching from the smaller side
+    def travel_time_matrix(self, sources, targets, hour, limit=None):
+        if len(targets) < len(sources):
+            return self.distances(targets, hour, limit, transpose=True)[:, sources].T.astype(np.float32)
+        return self.distances(sources, hour, limit)[:, targets].astype(np.float32)
+
+    # past_times-style table for every source and target: {(source id, target id, hour): time}
+    # with the data files' node IDs, leaving out pairs that are unreachable within limit
+    def past_times_table(self, sources, targets, hour, limit=None):
+        node_ids = self.network.node_ids
+        matrix = self.travel_time_matrix(sources, targets, hour, limit)
+        table = {}
+        for i, j in zip(*np.nonzero(np.isfinite(matrix))):
+            table[(node_ids[sources[i]], node_ids[targets[j]], hour)] = float(matrix[i, j])
+        return table
+
+if __name__ == "__main__":
+    from utils import RoadNetwork
+
+    parser = argparse.ArgumentParser(description="Precompute travel times with scipy.sparse.csgraph and compare with get_time")
+    parser.add_argument("--hour", type=int, default=8)
+    parser.add_argument("--sources", type=int, default=200, help="number of random source nodes")
+    parser.add_argument("--targets", type=int, default=200, help="number of random target nodes")
+    parser.add_argument("--limit", type=float, default=None, help="ignore pairs more than this many hours apart")
+    parser.add_argument("--sample", type=int, default=200, help="pairs timed with get_time for comparison")
+    parser.add_argument("--out", default=None, help="write the pairs to this file in past_times.json format")
+    args = parser.parse_args()
+
+    network = RoadNetwork()
+    backend = ScipyBackend(network)
+    n = len(network.first_edge) - 1
+    sources = [random.randrange(n) for _ in range(args.sources)]
+    targets = [random.randrange(n) for _ in range(args.targets)]
+
+    start_time = time.time()
+    backend.matrix(args.hour)
+    build_time = time.time() - start_time
+    start_time = time.time()
+    matrix = backend.travel_time_matrix(sources, targets, args.hour, args.limit)
+    scipy_time = time.time() - start_time
+    print(f"csr_matrix built in {build_time:.3f}s; {matrix.size} pairs in {scipy_time:.3f}s")
+
+    pairs = [(random.randrange(len(sources)), random.randrange(len(targets))) for _ in range(args.sample)]
+    start_time = time.time()
+    times = [network.get_time(sources[i], targets[j], args.hour) for i, j in pairs]
+    per_pair = (time.time() - start_time) / len(pairs)
+    error = max((abs(matrix[i, j] - t) / max(t, 1e-9) for (i, j), t in zip(pairs, times) if np.isfinite(matrix[i, j])), default=0)
+    print(f"get_time: {per_pair * 1000:.2f}ms per pair, {per_pair * matrix.size:.1f}s estimated for all pairs "
+          f"({per_pair * matrix.size / scipy_time:.0f}x slower); max relative difference {error:.1e}")
+
+    if args.out:
+        table = backend.past_times_table(sources, targets, args.hour, args.limit)
+        with open(args.out, "w") as file:
+            json.dump({str(key): value for key, value in table.items()}, file)
+        print(f"Wrote {len(table)} pairs to {args.out}")
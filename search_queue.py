@@ -0,0 +1,81 @@
+import argparse
+import random
+import time
+
+# Search keys are driving times in whole seconds (times from RoadNetwork are in hours).
+# Rounding down keeps the keys of a consistent A* non-decreasing
+def to_key(hours):
+    return int(hours * 3600)
+
+class RadixHeap:
+    '''
+        Monotone priority queue of (key, id) items with non-negative integer
+        keys, for Dijkstra and A* with a consistent heuristic, where no key
+        pushed is below the last one popped. Bucket i holds the items whose
+        key first differs from the last popped key in bit i - 1 (bucket 0 holds
+        keys equal to it). pop() empties the first non-empty bucket into lower
+        ones around its smallest key, and an item moves down at most once per
+        bit, so with the small keys of road searches (a few thousand seconds)
+        pushes are O(1) and pops O(log C) amortized, without comparing tuples.
+
+        Keys below the last popped key (floating point noise in a heuristic)
+        are treated as equal to it. Items with equal keys come out in no
+        particular order
+    '''
+
+    def __init__(self):
+        self.buckets = [[]]
+        self.last = 0
+        self.size = 0
+
+    def push(self, item):
+        key = item[0]
+        if key < self.last:
+            item = (self.last, item[1])
+            key = self.last
+        b = (key ^ self.last).bit_length()
+        while b >= len(self.buckets):
+            self.buckets.append([])
+        self.buckets[b].append(item)
+        self.size += 1
+
+    def pop(self):
+        if self.size == 0:
+            raise IndexError("pop from an empty radix heap")
+        buckets = self.buckets
+        if not buckets[0]:
+            b = 1
+            while not buckets[b]:
+                b += 1
+            items, buckets[b] = buckets[b], []
+            self.last = last = min(items)[0]
+            # Every item lands in a lower bucket: its key now agrees with last above bit b - 1
+            for item in items:
+                buckets[(item[0] ^ last).bit_length()].append(item)
+        self.size -= 1
+        return buckets[0].pop()
+
+    def __len__(self):
+        return self.size
+
+if __name__ == "__main__":
+    from utils import RoadNetwork
+
+    parser = argparse.ArgumentParser(description="Compare the radix heap search with the binary heap one")
+    parser.add_argument("--hour", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=500, help="number of random node pairs")
+    parser.add_argument("--heuristic", default="euclidean", choices=("euclidean", "djikstras"))
+    args = parser.parse_args()
+
+    network = RoadNetwork()
+    n = len(network.first_edge) - 1
+    pairs = [(random.randrange(n), random.randrange(n)) for _ in range(args.queries)]
+    start_time = time.time()
+    reference = [network.search_route(s, t, args.hour, args.heuristic).time for s, t in pairs]
+    heap_time = time.time() - start_time
+    start_time = time.time()
+    times = [network.search_route_radix(s, t, args.hour, args.heuristic).time for s, t in pairs]
+    radix_time = time.time() - start_time
+    error = max((abs(a - b) / max(b, 1e-9) for a, b in zip(times, reference) if a != b), default=0)
+    print(f"binary heap: {heap_time / len(pairs) * 1000:.3f}ms per query; radix heap: {radix_time / len(pairs) * 1000:.3f}ms "
+          f"per query ({heap_time / radix_time:.2f}x faster); max relative difference {error:.1e}")
@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import *
+from algorithms import *
+from bonus_algorithms import *
+
+# Ride matching service: wraps one of the matchers behind a JSON lines protocol on a
+# local TCP socket. Every message is one JSON object per line. Clients send
+#
+#   {"type": "ride", "request": ..., "time": t, "source_lat": .., "source_lon": ..,
+#    "dest_lat": .., "dest_lon": ..}
+#   {"type": "driver", "request": ..., "time": t, "lat": .., "lon": .., "rides": n}
+#   {"type": "driver", "request": ..., "driver": id, "lat": .., "lon": .., "available": bool}
+#
+# (times are epoch seconds, "rides" is optional and every field of a driver update
+# is optional) and get back
+#
+#   {"type": "assignment", "request": ..., "passenger": id, "driver": id}
+#   {"type": "driver", "request": ..., "driver": id}
+#   {"type": "rejected", "request": ..., "reason": ...}
+#
+# The fleet starts out as the drivers in data/drivers.csv. The simulated clock is
+# the latest time seen in any message; drivers become availible once the clock
+# passes their log-on or drop-off time, exactly like the batch scripts
+
+MATCHERS = {
+    "T1": T1_Matcher,
+    "T2": T2_Matcher,
+    "T3": T3_Matcher,
+    "T4": T4_Matcher,
+    "T5": T5_Matcher,
+    "B1": B1_Matcher,
+    "B2": B2_Matcher,
+    "B3": B3_Matcher,
+    "B4": B4_Matcher,
+}
+
+class Connection:
+    # Replies waiting to be written to one client; bounded so a client that stops
+    # reading is disconnected instead of growing memory or stalling the matching loop
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.outbox = asyncio.Queue(queue_size)
+        self.closed = False
+
+    # Queue a reply without waiting. Replies to closed connections are dropped, and a
+    # client whose outbox is full is cut off so one stuck reader cannot block everyone
+    def send(self, reply):
+        if self.closed:
+            return
+        try:
+            self.outbox.put_nowait(reply)
+        except asyncio.QueueFull:
+            self.closed = True
+            self.writer.transport.abort()
+
+    async def send_replies(self):
+        try:
+            while True:
+                reply = await self.outbox.get()
+                self.writer.write((json.dumps(reply) + "\n").encode())
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            self.closed = True
+
+class MatchingService:
+    '''
+        Accepts ride requests and driver updates from any number of clients and
+        runs them through the matcher in rounds: the matching loop takes
+        everything that arrived within batch_window seconds (at most max_batch
+        messages), applies it, matches waiting passengers (longest waiting
+        first) to availible drivers and sends out the assignments.
+
+        Backpressure comes from the bounded inbox (when it is full, connections
+        stop reading their sockets until the matching loop catches up) and the
+        cap on waiting passengers (requests over max_waiting are rejected). The
+        matching loop never waits on a client: one that lets queue_size replies
+        pile up unread is disconnected.
+        Rounds run on a single worker thread so the matcher is never used
+        concurrently and the event loop keeps accepting input while it works
+    '''
+
+    def __init__(self, matcher, queue_size=1024, max_batch=256, batch_window=0.01, max_waiting=10000):
+        self.matcher = matcher
+        self.inbox = asyncio.Queue(queue_size)
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.max_waiting = max_waiting
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        self.now = None
+        self.availible_drivers = DriverPool()
+        matcher.attach_pool(self.availible_drivers)
+        # Passengers waiting for a driver as (passenger id, connection, request)
+        self.waiting = deque()
+        # Drivers that went offline; they are kept out of the pool until they come back
+        self.offline = set()
+        self.parked = set()
+        self.rounds = 0
+
+    async def handle_client(self, reader, writer):
+        connection = Connection(writer, self.queue_size)
+        sender = asyncio.create_task(connection.send_replies())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    connection.send({"type": "rejected", "request": None, "reason": "invalid JSON"})
+                    continue
+                # Only objects with a numeric time (if any) reach the matching loop
+                if not isinstance(message, dict):
+                    connection.send({"type": "rejected", "request": None, "reason": "message is not a JSON object"})
+                    continue
+                when = message.get("time")
+                if when is not None and (isinstance(when, bool) or not isinstance(when, (int, float))):
+                    connection.send({"type": "rejected", "request": message.get("request"), "reason": "time is not a number"})
+                    continue
+                # Blocks while the inbox is full, which stops us reading from the socket
+                await self.inbox.put((message, connection))
+        except ConnectionError:
+            pass
+        finally:
+            connection.closed = True
+            sender.cancel()
+            writer.close()
+
+    async def run_rounds(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.inbox.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.inbox.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            replies = await loop.run_in_executor(self.executor, self.run_round, batch)
+            for connection, reply in replies:
+                connection.send(reply)
+
+    # Apply a batch of messages and match; returns the (connection, reply) pairs to send
+    def run_round(self, batch):
+        replies = []
+        for message, connection in batch:
+            request = None
+            try:
+                request = message.get("request")
+                if message.get("time") is not None:
+                    self.now = message["time"] if self.now is None else max(self.now, message["time"])
+                reply = self.apply(message, connection)
+            except (AttributeError, IndexError, KeyError, TypeError, ValueError) as error:
+                reply = {"type": "rejected", "reason": "bad message: " + repr(error)}
+            if reply is not None:
+                reply["request"] = request
+                replies.append((connection, reply))
+
+        if self.now is not None:
+            self.release_drivers()
+
+        # Match all availible drivers to the longest waiting passengers
+        while len(self.availible_drivers) > 0 and self.waiting:
+            passenger_id, connection, request = self.waiting.popleft()
+            try:
+                driver_id = self.matcher.match(self.availible_drivers, passenger_id)
+            except Exception as error:
+                # e.g. no candidate can reach the passenger; the next passengers still get matched
+                replies.append((connection, {"type": "rejected", "request": request, "reason": "matching failed: " + repr(error)}))
+                continue
+            replies.append((connection, {"type": "assignment", "request": request, "passenger": passenger_id, "driver": driver_id}))
+
+        self.rounds += 1
+        return replies
+
+    def apply(self, message, connection):
+        kind = message["type"]
+        if kind == "ride":
+            if len(self.waiting) >= self.max_waiting:
+                return {"type": "rejected", "reason": "too many waiting passengers"}
+            passenger_id = self.matcher.add_passenger(message["time"], message["source_lat"], message["source_lon"], message["dest_lat"], message["dest_lon"])
+            self.waiting.append((passenger_id, connection, message.get("request")))
+            return None
+        if kind == "driver":
+            if message.get("driver") is None:
+                driver_id = self.matcher.add_driver(message["time"], message["lat"], message["lon"], message.get("rides"))
+            else:
+                driver_id = message["driver"]
+                if isinstance(driver_id, bool) or not isinstance(driver_id, int) or not 0 <= driver_id < len(self.matcher.drivers):
+                    return {"type": "rejected", "reason": "unknown driver: " + repr(driver_id)}
+                self.update_driver(driver_id, message)
+            return {"type": "driver", "driver": driver_id}
+        return {"type": "rejected", "reason": "unknown message type: " + str(kind)}
+
+    def update_driver(self, driver_id, message):
+        driver = self.matcher.drivers[driver_id]
+        if "lat" in message and "lon" in message:
+            self.matcher.update_driver(driver_id, driver.time, driver.rides, message["lat"], message["lon"])
+            # The driver moved, so their snapped node has to be looked up again
+            self.matcher.nearest_nodes.pop(driver_id, None)
+            if self.matcher.driver_nodes is not None and driver_id in self.availible_drivers:
+                self.matcher.driver_nodes.move(driver_id)
+        if message.get("available") is False and driver_id not in self.offline:
+            self.offline.add(driver_id)
+            if driver_id in self.availible_drivers:
+                self.availible_drivers.remove(driver_id)
+                self.parked.add(driver_id)
+        elif message.get("available") is True and driver_id in self.offline:
+            self.offline.discard(driver_id)
+            if driver_id in self.parked:
+                self.parked.discard(driver_id)
+                self.availible_drivers.add(driver_id)
+
+    # Add all drivers availible at the current time to the availible drivers
+    def release_drivers(self):
+        drivers_pq = self.matcher.drivers_pq
+        while drivers_pq and drivers_pq.peek()[0] <= self.now:
+            _, driver_id = drivers_pq.pop()
+            if driver_id in self.offline:
+                self.parked.add(driver_id)
+            else:
+                self.availible_drivers.add(driver_id)
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle_client, host, port, limit=1 << 20)
+        rounds = asyncio.create_task(self.run_rounds())
+        print("Matching service listening on", host, port)
+        try:
+            async with server:
+                serving = asyncio.create_task(server.serve_forever())
+                done, _ = await asyncio.wait((serving, rounds), return_when=asyncio.FIRST_COMPLETED)
+                if rounds in done:
+                    # The matching loop died; stop taking input nobody would handle
+                    serving.cancel()
+                    rounds.result()
+                    raise Exception("The matching loop stopped")
+                serving.result()
+        finally:
+            rounds.cancel()
+            self.executor.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve one of the matchers over a local JSON lines socket")
+    parser.add_argument("--matcher", default="T5", choices=sorted(MATCHERS))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--event-queue", default=None, choices=["heap", "calendar"], help="defaults to EVENT_QUEUE, then heap")
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--batch-window", type=float, default=0.01)
+    parser.add_argument("--max-waiting", type=int, default=10000)
+    args = parser.parse_args()
+
+    matcher = MATCHERS[args.matcher](args.event_queue)
+    service = MatchingService(matcher, args.queue_size, args.max_batch, args.batch_window, args.max_waiting)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        if matcher.total_rides_completed:
+            matcher.summarize_experiments()
@@ -0,0 +1,21 @@
+import calendar
+from datetime import datetime, timedelta
+
+# The simulation runs on integer epoch seconds. Times from the CSVs are converted
+# once when they are read, and datetimes are only built again for output (plots)
+
+EPOCH = datetime(1970, 1, 1)
+
+# Naive datetimes from the data are treated as UTC so no time zone ever shifts an hour
+def to_epoch(date_time):
+    return calendar.timegm(date_time.timetuple())
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+def hour_of(seconds):
+    return seconds // 3600 % 24
+
+# Drive times from RoadNetwork are in hours
+def hours_to_seconds(hours):
+    return int(round(hours * 3600))
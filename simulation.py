@@ -0,0 +1,151 @@
+import os
+import pickle
+import random
+import time
+from collections import deque
+
+from driver_pool import DriverPool
+from event_log import PROGRESS
+from metrics import Metrics
+
+# Matcher attributes that are rebuilt from the data files when a matcher is created
+# and so are left out of checkpoints (the road network, spatial indexes over its
+# nodes and drivers, and the open event log)
+DERIVED = ("map", "events", "kd_tree", "sorted_nodes", "node_index", "isochrones", "driver_nodes")
+
+# Simulation attributes saved in a checkpoint
+STATE = ("availible_drivers", "unmatched_passengers", "curr_unmatched_passengers", "curr_time", "metrics", "runtime")
+
+CHECKPOINT_VERSION = 1
+
+class Simulation:
+    '''
+        The replay loop shared by the driver scripts: passengers are taken in
+        order of request time, drivers join the availible pool once the clock
+        reaches their log-on (or drop-off) time, and every availible driver is
+        matched to the longest waiting passengers.
+
+        The run can be checkpointed every checkpoint_every seconds of wall time
+        (CHECKPOINT_EVERY in the environment) and resumed from the last
+        checkpoint (RESUME=1). A checkpoint holds all mutable state: the
+        matcher's drivers, queues, caches and accumulators, B3's traffic, the
+        loop's queues and clock, the metrics, the random state and how far the
+        event log got. The road network is only referenced by the hash of its
+        data files and is loaded as usual when the matcher is created
+    '''
+
+    def __init__(self, matcher, name, checkpoint_every=None):
+        self.matcher = matcher
+        self.name = name
+        self.checkpoint_path = name.lower() + "_checkpoint.pkl"
+        self.events_path = name.lower() + "_events.bin"
+        if checkpoint_every is None:
+            checkpoint_every = float(os.environ.get("CHECKPOINT_EVERY", 0))
+        self.checkpoint_every = checkpoint_every
+
+        # Priority queue of availible drivers
+        self.availible_drivers = DriverPool()
+        matcher.attach_pool(self.availible_drivers)
+        # List of all unmatched passengers by increasing time
+        self.unmatched_passengers = deque([[id, data] for id, data in enumerate(matcher.passengers)])
+        # Unmatched at current time
+        self.curr_unmatched_passengers = deque([self.unmatched_passengers.popleft()])
+        # Time of simulation start is the time of the first passenger, since it is sorted by time increasing
+        self.curr_time = self.curr_unmatched_passengers[0][1].time
+        # Summary statistics
+        self.metrics = Metrics()
+        # Wall time spent in earlier runs that this one resumed from
+        self.runtime = 0
+
+    def step(self):
+        matcher = self.matcher
+
+        # Check to see if any new drivers have logged on
+        # Add all drivers availible at current time to the availible drivers (in order of increasing time)
+        while matcher.drivers_pq and matcher.drivers_pq.peek()[0] <= self.curr_time:
+            _, driver_id = matcher.drivers_pq.pop()
+            self.availible_drivers.add(driver_id)
+
+        # Keep track of number of passengers looking for a ride and the number of availible drivers
+        self.metrics.record(self.curr_time, passengers=len(self.curr_unmatched_passengers), drivers=len(self.availible_drivers))
+
+        # Match all availible drivers to customers
+        while len(self.availible_drivers) > 0 and len(self.curr_unmatched_passengers) > 0:
+            # Since curr_unmatched_passengers is sorted increasing by time
+            # this will be the longest waiting passenger
+            passenger = self.curr_unmatched_passengers.popleft()
+            matcher.match(self.availible_drivers, passenger[0])
+            self.metrics.record(self.curr_time, d1=matcher.d1, d2=matcher.d2)
+
+        # Set the current time to the next unmatched passenger's log-in time
+        self.curr_unmatched_passengers.append(self.unmatched_passengers.popleft())
+
+        if len(self.unmatched_passengers) > 0:
+            self.curr_time = self.unmatched_passengers[0][1].time
+
+    def run(self, resume=None):
+        if resume is None:
+            resume = os.environ.get("RESUME") == "1"
+        if resume and os.path.exists(self.checkpoint_path):
+            self.restore(self.checkpoint_path)
+        else:
+            self.matcher.events.open(self.events_path)
+
+        start_time = time.time()
+        last_checkpoint = start_time
+        while len(self.unmatched_passengers) > 0 and len(self.curr_unmatched_passengers) > 0:
+            self.step()
+
+            events = self.matcher.events
+            events.say(PROGRESS, len(self.unmatched_passengers), len(self.curr_unmatched_passengers), len(self.availible_drivers))
+            end_time = time.time()
+            execution_time = self.runtime + end_time - start_time
+            events.say(PROGRESS, self.name + " total runtime:", execution_time)
+            events.say(PROGRESS, "Total D1:", self.matcher.d1)
+            events.say(PROGRESS, "Total D2:", self.matcher.d2)
+            if hasattr(self.matcher, "match_counter"):
+                events.say(PROGRESS, "Total matches:", self.matcher.match_counter)
+
+            if self.checkpoint_every and end_time - last_checkpoint >= self.checkpoint_every:
+                self.runtime = execution_time
+                start_time = last_checkpoint = end_time
+                self.checkpoint(self.checkpoint_path)
+
+        # The run finished, so there is nothing left to resume
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def checkpoint(self, path):
+        matcher = self.matcher
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "network": matcher.map.data_hash(),
+            "matcher": {key: value for key, value in vars(matcher).items() if key not in DERIVED},
+            "traffic": matcher.map.traffic,
+            "simulation": {key: getattr(self, key) for key in STATE},
+            "events": (matcher.events.count, matcher.events.tell()),
+            "random": random.getstate(),
+        }
+        # Write to a temporary file first so a crash mid-write keeps the previous checkpoint
+        with open(path + ".tmp", "wb") as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def restore(self, path):
+        with open(path, "rb") as file:
+            state = pickle.load(file)
+        if state["version"] != CHECKPOINT_VERSION:
+            raise Exception("Unsupported checkpoint version: " + str(state["version"]))
+        matcher = self.matcher
+        if state["network"] != matcher.map.data_hash():
+            raise Exception("Checkpoint " + path + " was made with different road network data")
+
+        vars(matcher).update(state["matcher"])
+        matcher.map.traffic = state["traffic"]
+        vars(self).update(state["simulation"])
+        matcher.attach_pool(self.availible_drivers)
+        random.setstate(state["random"])
+
+        count, offset = state["events"]
+        matcher.events.count = count
+        matcher.events.open(self.events_path, offset)
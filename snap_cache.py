@@ -0,0 +1,58 @@
+import functools
+import time
+from collections import OrderedDict
+
+class SnapCache:
+    '''
+        Bounded LRU cache from a coordinate, quantized to a grid of `grid`
+        degrees, to the node it snaps to. Pickups and drop-offs cluster around
+        the same few places (stations, airports), so most snaps become a dict lookup
+    '''
+
+    def __init__(self, grid=1e-4, capacity=100000):
+        self.grid = grid
+        self.capacity = capacity
+        self.nodes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, lat, lon):
+        return (round(lat / self.grid), round(lon / self.grid))
+
+    def get(self, key):
+        node = self.nodes.get(key)
+        if node is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.nodes.move_to_end(key)
+        return node
+
+    def put(self, key, node):
+        self.nodes[key] = node
+        if len(self.nodes) > self.capacity:
+            # Evict the least recently used coordinate
+            self.nodes.popitem(last=False)
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+# Decorator for get_closest_nodes implementations: look the coordinate up in the
+# matcher's snap_cache first and only run the real search on a miss. The search times
+# and counts itself in get_closest_total_time/calls; hits are added here so those stay
+# totals over every call
+def cached_snap(get_closest_nodes):
+    @functools.wraps(get_closest_nodes)
+    def wrapper(self, lat, lon):
+        start_time = time.time()
+        key = self.snap_cache.key(lat, lon)
+        node = self.snap_cache.get(key)
+        if node is None:
+            node = get_closest_nodes(self, lat, lon)
+            self.snap_cache.put(key, node)
+        else:
+            self.get_closest_total_time += time.time() - start_time
+            self.get_closest_total_calls += 1
+        return node
+    return wrapper
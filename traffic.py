@@ -0,0 +1,66 @@
+import heapq
+from array import array
+from collections import defaultdict
+
+class Congestion:
+    '''
+        Per-hour congestion layer used by B3. Load is stored as an array aligned
+        with the road network's compact edge list, so edge i of the network has
+        its number of drivers in load[hour][i] and its travel time multiplier in
+        multiplier[hour][i]. Every time a route is added we also remember when the
+        driver leaves it, and release() takes the load back off once the simulated
+        time has passed that point (so traffic does not only ever grow)
+    '''
+
+    def __init__(self, num_edges):
+        self.num_edges = num_edges
+        # Arrays are only allocated for hours that have seen traffic
+        self.load = {}
+        self.multiplier = {}
+        # Heap of (release time, sequence number, hour, edges) for pending releases
+        self.pending = []
+        self.sequence = 0
+        # Edges whose multiplier changed, per hour, since the last take_changes (for crp.Overlay)
+        self.changed = defaultdict(set)
+
+    def get_multiplier(self, hour):
+        # Returns None when the hour has no traffic so searches can skip the multiply
+        return self.multiplier.get(hour)
+
+    def add(self, edges, hour, until):
+        if hour not in self.load:
+            self.load[hour] = array("i", bytes(4 * self.num_edges))
+            self.multiplier[hour] = array("d", [1.0]) * self.num_edges
+        load, multiplier = self.load[hour], self.multiplier[hour]
+        changed = self.changed[hour]
+        for e in edges:
+            load[e] += 1
+            # Same rule as before: the first driver on a road does not slow it down,
+            # every driver after that adds another free-flow travel time
+            if load[e] > 1:
+                multiplier[e] = load[e]
+                changed.add(e)
+        # Sequence number breaks ties so the heap never has to compare edge lists
+        heapq.heappush(self.pending, (until, self.sequence, hour, edges))
+        self.sequence += 1
+
+    def release(self, now):
+        # Remove the load of every route whose driver has already passed through it
+        while self.pending and self.pending[0][0] <= now:
+            _, _, hour, edges = heapq.heappop(self.pending)
+            load, multiplier = self.load[hour], self.multiplier[hour]
+            changed = self.changed[hour]
+            for e in edges:
+                load[e] -= 1
+                # Going from one driver to none leaves the multiplier at 1
+                if load[e] >= 1:
+                    multiplier[e] = load[e]
+                    changed.add(e)
+
+    # Return and forget the edges of `hour` whose multiplier changed since the last call
+    def take_changes(self, hour):
+        return self.changed.pop(hour, set())
+
+    def total_load(self, hour=None):
+        hours = self.load.keys() if hour is None else [hour]
+        return sum(sum(self.load[h]) for h in hours if h in self.load)
@@ -0,0 +1,142 @@
+import argparse
+import heapq
+import multiprocessing
+import random
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from scipy_backend import scipy_available
+
+INF = float("inf")
+
+STRATEGIES = ("auto", "dijkstra", "hub_labels", "scipy")
+
+# Network used by worker processes. Workers are forked after it is set, so they share
+# it instead of unpickling a copy (the network holds lambdas and cannot be pickled)
+shared_network = None
+
+# Times from root to every node in targets (in order), by one Dijkstra over the compact
+# edge list that stops once every target is settled. With reverse=True the search runs
+# over the reversed roads, giving the times from every target to root
+def one_to_many(network, root, targets, hour, reverse=False):
+    if reverse:
+        first, edge_ids, heads = network.reverse_edge_list()
+    else:
+        first, heads = network.first_edge, network.edge_head
+    edge_time = network.edge_time[hour]
+    remaining = set(targets)
+    pq, dist = [(0.0, root)], {root: 0.0}
+    while pq and remaining:
+        cost, u = heapq.heappop(pq)
+        if cost > dist[u]:
+            continue
+        remaining.discard(u)
+        for r in range(first[u], first[u + 1]):
+            v = heads[r]
+            new_dist = cost + edge_time[edge_ids[r] if reverse else r]
+            if new_dist < dist.get(v, INF):
+                dist[v] = new_dist
+                heapq.heappush(pq, (new_dist, v))
+    return [dist.get(t, INF) for t in targets]
+
+def one_to_many_rows(args):
+    roots, targets, hour, reverse = args
+    return [one_to_many(shared_network, root, targets, hour, reverse) for root in roots]
+
+# Repeated one-to-many Dijkstra, from whichever side has fewer nodes
+def dijkstra_matrix(network, sources, targets, hour, processes=None):
+    global shared_network
+    reverse = len(targets) < len(sources)
+    roots, others = (targets, sources) if reverse else (sources, targets)
+
+    # Workers need fork to share the network, so without it (Windows) the searches run here
+    if processes and processes > 1 and len(roots) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        shared_network = network
+        chunk = -(-len(roots) // processes)
+        tasks = [(roots[i:i + chunk], others, hour, reverse) for i in range(0, len(roots), chunk)]
+        with multiprocessing.get_context("fork").Pool(processes) as pool:
+            rows = [row for rows in pool.map(one_to_many_rows, tasks) for row in rows]
+        shared_network = None
+    else:
+        rows = [one_to_many(network, root, others, hour, reverse) for root in roots]
+
+    matrix = np.array(rows, dtype=np.float32).reshape(len(roots), len(others))
+    return matrix.T.copy() if reverse else matrix
+
+# Many-to-many over hub labels: every target's in-label entries go into a bucket per
+# hub, then each source's out-label is scanned once against those buckets
+def hub_label_matrix(labels, sources, targets, hour):
+    out_offsets, out_hubs, out_times, in_offsets, in_hubs, in_times = labels.labels[hour]
+    buckets = defaultdict(list)
+    for j, t in enumerate(targets):
+        for k in range(in_offsets[t], in_offsets[t + 1]):
+            buckets[in_hubs[k]].append((j, in_times[k]))
+
+    matrix = np.empty((len(sources), len(targets)), dtype=np.float32)
+    for i, s in enumerate(sources):
+        row = [INF] * len(targets)
+        for k in range(out_offsets[s], out_offsets[s + 1]):
+            d = out_times[k]
+            for j, t in buckets.get(out_hubs[k], ()):
+                if d + t < row[j]:
+                    row[j] = d + t
+        matrix[i] = row
+    return matrix
+
+# Driving times (hours) from every node in sources to every node in targets as a dense
+# float32 array of shape (len(sources), len(targets)); unreachable pairs are inf.
+# "auto" uses hub labels when the hour has them (see hub_labels.py), then SciPy's csgraph
+# if it is installed (see scipy_backend.py) and no processes are asked for, and Dijkstra
+# otherwise; processes > 1 spreads the Dijkstra searches over that many worker processes
+# where the platform can fork them.
+# The first SciPy call of a network also imports scipy and builds the hour's csr_matrix
+# (about 0.2s on the sample grid, where a small matrix takes 0.01s with Dijkstra), so it
+# pays off for big or repeated matrices; pass "dijkstra" for a few one-off pairs
+def travel_time_matrix(network, sources, targets, hour, strategy="auto", processes=None):
+    if strategy not in STRATEGIES:
+        raise Exception("Unknown travel time matrix strategy: " + strategy)
+    sources, targets = list(sources), list(targets)
+    if strategy in ("auto", "hub_labels"):
+        labels = network.get_hub_labels()
+        if labels.load(hour):
+            return hub_label_matrix(labels, sources, targets, hour)
+        if strategy == "hub_labels":
+            raise Exception(f"No hub labels for hour {hour}; build them with python hub_labels.py {hour}")
+    if strategy == "scipy" or (strategy == "auto" and processes is None and scipy_available()):
+        return network.get_scipy_backend().travel_time_matrix(sources, targets, hour)
+    return dijkstra_matrix(network, sources, targets, hour, processes)
+
+if __name__ == "__main__":
+    from utils import RoadNetwork
+
+    parser = argparse.ArgumentParser(description="Benchmark travel time matrices against calling get_time for every pair")
+    parser.add_argument("--sources", type=int, default=50, help="number of random source nodes")
+    parser.add_argument("--targets", type=int, default=50, help="number of random target nodes")
+    parser.add_argument("--hour", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4, help="worker processes for the parallel run")
+    args = parser.parse_args()
+
+    network = RoadNetwork()
+    n = len(network.first_edge) - 1
+    sources = [random.randrange(n) for _ in range(args.sources)]
+    targets = [random.randrange(n) for _ in range(args.targets)]
+
+    start_time = time.time()
+    naive = np.array([[network.get_time(s, t, args.hour) for t in targets] for s in sources], dtype=np.float32)
+    naive_time = time.time() - start_time
+    print(f"get_time for {len(sources) * len(targets)} pairs: {naive_time:.3f}s")
+
+    runs = [("dijkstra", None), ("dijkstra", args.processes)]
+    if scipy_available():
+        runs.append(("scipy", None))
+    if network.get_hub_labels().load(args.hour):
+        runs.append(("hub_labels", None))
+    for strategy, processes in runs:
+        start_time = time.time()
+        matrix = travel_time_matrix(network, sources, targets, args.hour, strategy, processes)
+        elapsed = time.time() - start_time
+        error = np.max(np.where(matrix == naive, 0, np.abs(matrix - naive) / np.maximum(naive, 1e-9)))
+        label = strategy if processes is None else f"{strategy} x{processes}"
+        print(f"{label}: {elapsed:.3f}s ({naive_time / elapsed:.1f}x faster, max relative difference {error:.1e})")
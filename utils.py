@@ -1,19 +1,47 @@
 
+import bisect
+import hashlib
 import heapq
 import math
 import json
+import os
 import time
 import random
 
+from array import array
 from collections import defaultdict
 from datetime import datetime, timedelta
 import time as timer
 import time as timer
 
+import numpy as np
+
+from crp import Overlay, Partition
+from driver_pool import DriverPool
+from event_log import LOOKUPS, PROGRESS, RIDES, EventLog
+from event_queue import make_event_queue
+from fleet import Fleet, Passenger
+from hub_labels import HubLabels
+from isochrone import DriverNodeIndex
+from jit_search import JitSearch
+from routes import NO_ROUTE, Route, RouteCache
+from rtree import EdgeRTree
+from scipy_backend import ScipyBackend
+from search_queue import RadixHeap, to_key
+from sim_clock import from_epoch, hour_of, hours_to_seconds, to_epoch
+from snap_cache import SnapCache, cached_snap
+from traffic import Congestion
+from travel_matrix import travel_time_matrix
+
 class BaseMatcher:
 
-    def __init__(self):
+    # event_queue picks the driver availability queue: "heap" or "calendar" (by default
+    # from the EVENT_QUEUE environment variable, "heap" if it is not set)
+    def __init__(self, event_queue=None):
         self.map = RoadNetwork()
+        self.event_queue = os.environ.get("EVENT_QUEUE", "heap") if event_queue is None else event_queue
+        if self.event_queue not in ("heap", "calendar"):
+            raise Exception("Unknown event queue: " + self.event_queue)
         self.drivers = read_drivers("data/drivers.csv")
         self.passengers = read_passengers("data/passengers.csv")
         # Stores nearest node for each driver
@@ -31,12 +59,92 @@ class BaseMatcher:
         self.total_pickup_time = 0
         self.total_drive_time = 0
         self.past_times = dict()
+        # Cache of snapped coordinates in front of get_closest_nodes
+        self.snap_cache = SnapCache()
+        # Per-ride records, written to disk once a script opens a file for them (until
+        # then they are only counted)
+        self.events = EventLog()
+        # How candidate drivers are found (see find_candidates): "euclidean" or "network"
+        self.candidates = os.environ.get("CANDIDATES", "euclidean")
+        if self.candidates not in ("euclidean", "network"):
+            raise Exception("Unknown candidate mode: " + self.candidates)
+        # Pickup times found while looking for candidates, by (driver id, passenger node, hour)
+        self.candidate_times = dict()
+        # How far (in hours of driving) the "network" candidate search looks before
+        # leaving the rest to euclidean distance
+        self.candidate_limit = 0.5
+        # Isochrone index (T5) and the availible drivers by node, when a mode needs them
+        self.isochrones = None
+        self.driver_nodes = None
+
+    # Called with the pool of availible drivers before matching starts (and again when a
+    # checkpointed pool is restored) to register pool listeners
+    def attach_pool(self, availible_drivers):
+        if self.candidates == "network" or self.isochrones is not None:
+            # Follow where the availible drivers are so road searches can pick them up
+            self.driver_nodes = DriverNodeIndex(self)
+            availible_drivers.add_listener(self.driver_nodes)
 
     def update_driver(self, id, time, rides, lat, lon):
-        self.drivers[id] = {"time": time, "rides": rides,
-                            "source_lat": lat, "source_lon": lon}
-    
+        # Update the driver's record in place rather than allocating a new one per ride
+        self.drivers.update(id, time, rides, lat, lon)
+
+    # Log on a new driver at `time` (epoch seconds); they become availible once the
+    # simulation reaches that time. Returns the new driver id
+    def add_driver(self, time, lat, lon, rides=None):
+        if rides is None:
+            rides = random.randint(10, 12)
+        id = self.drivers.add(time, rides, lat, lon)
+        self.drivers_pq.push((time, id))
+        return id
+
+    # Add a ride request made at `time` (epoch seconds). Returns the new passenger id
+    def add_passenger(self, time, source_lat, source_lon, dest_lat, dest_lon):
+        self.passengers.append(Passenger(time, source_lat, source_lon, dest_lat, dest_lon))
+        return len(self.passengers) - 1
+
+    # Ids of the k availible drivers closest to (lat, lon) by euclidean distance,
+    # closest first. Distances are computed for all drivers in one numpy call
+    def rank_candidates(self, availible_drivers, lat, lon, k):
+        ids = np.fromiter(availible_drivers, dtype=np.intp, count=len(availible_drivers))
+        return ids[self.drivers.rank_by_distance(ids, lat, lon, k)].tolist()
+
+    # The k candidate drivers for a passenger, closest first: by euclidean distance, or in
+    # "network" mode by driving time, from one search out of the passenger's node over the
+    # reversed roads (with B3's traffic if asked) that stops at candidate_limit hours. That
+    # search already gives the pickup times, so they are kept in candidate_times for
+    # get_pickup_time. Places it leaves free go to the closest other drivers by distance
+    def find_candidates(self, availible_drivers, passenger_id, passenger_node, k, traffic=False):
+        passenger = self.passengers[passenger_id]
+        self.candidate_times = dict()
+        if self.candidates == "euclidean":
+            return self.rank_candidates(availible_drivers, passenger.source_lat, passenger.source_lon, k)
+
+        hour = hour_of(passenger.time)
+        multiplier = self.map.traffic.get_multiplier(hour) if traffic else None
+        found = self.driver_nodes.closest_by_road(passenger_node, hour, k, multiplier, self.candidate_limit)
+        for driver_id, pickup_time in found:
+            # Drivers who became availible in a later hour than the request drive in that hour
+            if hour_of(max(self.drivers[driver_id].time, passenger.time)) == hour:
+                self.candidate_times[(driver_id, passenger_node, hour)] = pickup_time
+        ranked = [driver_id for driver_id, _ in found]
+        if len(ranked) < k:
+            # Fewer than k drivers within the limit; the closest others by distance fill the rest
+            others = self.rank_candidates(availible_drivers, passenger.source_lat, passenger.source_lon, k)
+            ranked.extend([driver_id for driver_id in others if driver_id not in ranked][:k - len(ranked)])
+        return ranked
+
+    # Time for a candidate to reach the passenger; reuses the candidate search when it has
+    # it (times are keyed by the passenger's node and hour, so ones left over from another
+    # passenger are never used)
+    def get_pickup_time(self, driver_id, driver_node, passenger_node, hour):
+        key = (driver_id, passenger_node, hour)
+        if key in self.candidate_times:
+            return self.candidate_times[key]
+        return self.map.get_time(driver_node, passenger_node, hour)
+
     # Override if neccesary
+    @cached_snap
     def get_closest_nodes(self, lat, lon):
 
         # Start timing current procedure
@@ -62,26 +170,21 @@ class BaseMatcher:
     def complete_ride(self, driver, passenger, driver_node=None, passenger_node=None, pickup_time=None, heuristic="euclidean"):
 
         # Find closest nodes to each of driver and passenger
-        if not driver_node:
-            driver_node = self.get_closest_nodes(self.drivers[driver]["source_lat"], self.drivers[driver]["source_lon"]) if not driver in self.nearest_nodes.keys() else self.nearest_nodes[driver]
-        if not passenger_node:
-            passenger_node = self.get_closest_nodes(self.passengers[passenger]["source_lat"], self.passengers[passenger]["source_lon"])
-        dest_node = self.get_closest_nodes(self.passengers[passenger]["dest_lat"], self.passengers[passenger]["dest_lon"])
+        if driver_node is None:
+            driver_node = self.get_closest_nodes(self.drivers[driver].source_lat, self.drivers[driver].source_lon) if not driver in self.nearest_nodes.keys() else self.nearest_nodes[driver]
+        if passenger_node is None:
+            passenger_node = self.get_closest_nodes(self.passengers[passenger].source_lat, self.passengers[passenger].source_lon)
+        dest_node = self.get_closest_nodes(self.passengers[passenger].dest_lat, self.passengers[passenger].dest_lon)
         
-        # Calculate starting drive hour; note that we check for the day in the case which
-        # a driver logs in at 23h the night before, and the passenger is requesting a ride
-        # the day after at an early time, (say at 0h or 1h)
-        if self.drivers[driver]["time"].day < self.passengers[passenger]["time"].day:
-            hour = self.passengers[passenger]["time"].hour
-        elif self.drivers[driver]["time"].day > self.passengers[passenger]["time"].day:
-            hour = self.drivers[driver]["time"].hour
-        else:
-            hour = max(self.drivers[driver]["time"].hour, self.passengers[passenger]["time"].hour)
+        # Calculate starting drive hour; this is the hour of whichever of the driver and the
+        # passenger is ready last (e.g. a driver who logged in at 23h the night before
+        # picking up a passenger who requested a ride at 0h or 1h drives in hour 0 or 1)
+        hour = hour_of(max(self.drivers[driver].time, self.passengers[passenger].time))
 
         # Calculate driving time for driver to reach passenger
         if not pickup_time:
             start_time = time.time()
-            pickup_time = self.map.get_time(driver_node, passenger_node, hour, heuristic=heuristic)
+            pickup_time = self.map.get_route(driver_node, passenger_node, hour, heuristic=heuristic).time
             end_time = time.time()
             self.get_shortest_path_total_time += (end_time - start_time)
             self.get_shortest_path_total_calls += 1
@@ -90,12 +193,12 @@ class BaseMatcher:
                 self.past_times[(driver_node, passenger_node)] = pickup_time
 
         # Time to get to pickup location is start time + time to drive to pickup location
-        new_time = timedelta(hours=pickup_time) + max(self.drivers[driver]["time"], self.passengers[passenger]["time"])
-        self.total_wait_time += (max(self.drivers[driver]["time"], self.passengers[passenger]["time"]) - self.passengers[passenger]["time"]).total_seconds() / 60
+        new_time = hours_to_seconds(pickup_time) + max(self.drivers[driver].time, self.passengers[passenger].time)
+        self.total_wait_time += (max(self.drivers[driver].time, self.passengers[passenger].time) - self.passengers[passenger].time) / 60
 
         # Calculate driving time from passenger to their destination
         start_time = time.time()
-        driving_time = self.map.get_time(passenger_node, dest_node, hour, heuristic=heuristic)
+        driving_time = self.map.get_route(passenger_node, dest_node, hour, heuristic=heuristic).time
 
         end_time = time.time()
         self.get_shortest_path_total_time += (end_time - start_time)
@@ -106,22 +209,21 @@ class BaseMatcher:
         
         # Start time at pickup location + time to drive to arrival location
         # So this is just dropoff time
-        new_time = timedelta(hours=driving_time) + new_time
+        new_time = hours_to_seconds(driving_time) + new_time
 
         # Update the closest node to the driver to the passenger's destination node
         self.nearest_nodes[driver] = dest_node
 
         # Final arrival time - passenger login time
-        self.d1 += ((new_time - self.passengers[passenger]["time"]).total_seconds() / 60)
+        self.d1 += ((new_time - self.passengers[passenger].time) / 60)
         self.d2 += (driving_time - pickup_time) * 60
-        print("D1: ", (new_time - self.passengers[passenger]["time"]).total_seconds() / 60)
-        print("D2: ", (driving_time - pickup_time) * 60)
+        self.log_ride(driver, passenger, driver_node, passenger_node, dest_node, pickup_time, driving_time, new_time)
 
         self.total_pickup_time += pickup_time * 60
         self.total_drive_time += driving_time * 60
 
         # Decrement the number of rides the driver has left before they are too exhausted
-        rides = self.drivers[driver]["rides"] - 1
+        rides = self.drivers[driver].rides - 1
         self.total_rides_completed += 1
 
         if rides <= 0:
@@ -132,9 +234,19 @@ class BaseMatcher:
             self.update_driver(driver, new_time, rides, self.map.node_to_latlon[dest_node]["lat"], self.map.node_to_latlon[dest_node]["lon"])
             return True
 
+    # Record a completed ride in the event log; D1 and D2 are only printed at RIDES verbosity
+    def log_ride(self, driver, passenger, driver_node, passenger_node, dest_node, pickup_time, driving_time, dropoff_time):
+        d1 = (dropoff_time - self.passengers[passenger].time) / 60
+        d2 = (driving_time - pickup_time) * 60
+        pickup_at = dropoff_time - hours_to_seconds(driving_time)
+        self.events.ride(passenger, driver, self.passengers[passenger].time, pickup_at, dropoff_time, driver_node, passenger_node, dest_node, d1, d2)
+        self.events.say(RIDES, "D1: ", d1)
+        self.events.say(RIDES, "D2: ", d2)
+
     # Override implementation for each T_i algorithm
     # This method takes in a passenger and returns the "best" driver to match
-    # with that passenger given some metric
+    # with that passenger given some metric (the matched driver is removed from
+    # availible_drivers and its id is returned)
     def match(self, availible_drivers, passenger_id):
         raise Exception("Not implemented")
     
@@ -155,17 +267,89 @@ class BaseMatcher:
         print("---------D3------------")
         print("Total time spent finding closest nodes:", self.get_closest_total_time)
         print("Average time spent finding closest nodes:", self.get_closest_total_time / self.get_closest_total_calls)
+        print("Closest node cache hit ratio:", self.snap_cache.hit_ratio())
+        print("Route cache hit ratio:", self.map.route_cache.hit_ratio())
         print("Total time spent finding shortest paths:", self.get_shortest_path_total_time)
         print("Average time spent finding shortest paths:", self.get_shortest_path_total_time / self.get_shortest_path_total_calls)
+        if self.map.jit_search is not None:
+            print("Search kernel (" + self.map.jit_search.backend + ") warm-up time:", self.map.jit_search.compile_time)
 
 class RoadNetwork:
 
     def __init__(self):
-        self.graph, self.edge_data, self.speed_limit = read_adjacency("data/adjacency.json")
-        self.node_to_latlon = read_node_data("data/node_data.json")
-        
+        # Node IDs from the data files are interned to small ints on load; every
+        # structure below is keyed by those ints and node_ids maps back for I/O
+        self.node_ids = NodeIds()
+        self.graph, self.edge_data, self.speed_limit = read_adjacency("data/adjacency.json", self.node_ids)
+        self.node_to_latlon = read_node_data("data/node_data.json", self.node_ids)
+        self.build_edge_list()
+
         # Used Only For B3
-        self.traffic = {}
+        self.traffic = Congestion(len(self.edge_head))
+        # Routes computed through get_route, reused for repeated trips
+        self.route_cache = RouteCache()
+        # R-tree over road segments, built on the first get_closest_segment call
+        self.segment_index = None
+        # Hash of the data files, computed on the first data_hash call
+        self.hash = None
+        # Least driving time per degree of straight-line distance, by hour (see time_lower_bound)
+        self.time_per_degree = {}
+        # Hub labels saved by hub_labels.py, opened on the first get_hub_labels call
+        self.hub_labels = None
+        # SciPy csgraph backend, created on the first get_scipy_backend call
+        self.scipy_backend = None
+        # Multi-level partition and per-(hour, traffic) overlays, built on first use of get_overlay
+        self.partition = None
+        self.overlays = {}
+        # Which search get_time runs: "reference" (below) or "jit" (see jit_search.py). The
+        # kernel is compiled here so its warm-up is paid at startup, not on the first ride
+        self.search_backend = os.environ.get("SEARCH_BACKEND", "reference")
+        if self.search_backend not in ("reference", "jit"):
+            raise Exception("Unknown search backend: " + self.search_backend)
+        self.jit_search = None
+        if self.search_backend == "jit":
+            self.get_jit_search()
+        # Priority queue of the searches behind get_time and get_route: "heap" or "radix"
+        # (see search_route_radix)
+        self.search_queue = os.environ.get("SEARCH_QUEUE", "heap")
+        if self.search_queue not in ("heap", "radix"):
+            raise Exception("Unknown search queue: " + self.search_queue)
+
+    # SHA-256 of the files the network is built from. Checkpoints store this instead
+    # of the network, which never changes during a run
+    def data_hash(self):
+        if self.hash is None:
+            digest = hashlib.sha256()
+            for path in ("data/adjacency.json", "data/node_data.json"):
+                with open(path, "rb") as file:
+                    for chunk in iter(lambda: file.read(1 << 20), b""):
+                        digest.update(chunk)
+            self.hash = digest.hexdigest()
+        return self.hash
+
+    # Build a compact (CSR) copy of the graph: the outgoing edges of node u are
+    # edge_head[first_edge[u]:first_edge[u + 1]]. Per-hour edge times are stored
+    # in arrays aligned with this edge numbering
+    def build_edge_list(self):
+        self.first_edge = array("i", [0])
+        self.edge_head = array("i")
+        self.edge_time = defaultdict(lambda: array("d"))
+        hours = sorted({hour for hours in self.edge_data.values() for hour in hours})
+        for u in range(len(self.node_ids)):
+            for v in self.graph.get(u, []):
+                self.edge_head.append(v)
+                for hour in hours:
+                    self.edge_time[hour].append(self.edge_data[(u, v)][hour]["time"])
+            self.first_edge.append(len(self.edge_head))
+
+        # The reverse (incoming) edge list, built on the first reverse_edge_list call
+        self.reverse_first_edge = None
+        self.reverse_edge_ids = None
+        self.reverse_edge_tails = None
+
+        # Coordinates by node index for the search heuristics
+        self.node_lat = array("d", [self.node_to_latlon[u]["lat"] for u in range(len(self.node_ids))])
+        self.node_lon = array("d", [self.node_to_latlon[u]["lon"] for u in range(len(self.node_ids))])
 
     def get_neighbors(self, u):
         return self.graph[u]
@@ -185,9 +369,30 @@ class RoadNetwork:
         # Return euclidean norm; assume we are on a locally flat plane
         return math.sqrt((lon_u - lon_v) ** 2 + (lat_u - lat_v) ** 2)
     
+    # Lower bound on the driving time from u to v in the given hour: the straight-line
+    # distance times the least time any road of that hour takes per degree of straight-line
+    # distance. Every route is at least that long by the triangle inequality. (speed_limit
+    # is in miles per hour while coordinates are in degrees, so it only gives a much weaker bound)
+    def time_lower_bound(self, u, v, hour):
+        if hour not in self.time_per_degree:
+            edge_time, best = self.edge_time[hour], float("inf")
+            for u_e in range(len(self.first_edge) - 1):
+                for e in range(self.first_edge[u_e], self.first_edge[u_e + 1]):
+                    v_e = self.edge_head[e]
+                    length = math.sqrt((self.node_lat[u_e] - self.node_lat[v_e]) ** 2 + (self.node_lon[u_e] - self.node_lon[v_e]) ** 2)
+                    if length > 0:
+                        best = min(best, edge_time[e] / length)
+            self.time_per_degree[hour] = best if best < float("inf") else 0
+        return math.sqrt((self.node_lat[u] - self.node_lat[v]) ** 2 + (self.node_lon[u] - self.node_lon[v]) ** 2) * self.time_per_degree[hour]
+
     # This method computes the shortest time needed for the driver to reach
     # a passenger at some (lat, lon) coord. Default implementation is A* with a euclidean heuristic
     def get_time(self, s, t, hour, heuristic="euclidean"):
+        # The search kernel only takes consistent heuristics; manhattan stays on this search
+        if self.search_backend == "jit" and heuristic != "manhattan":
+            return self.jit_search.get_time(s, t, hour, heuristic)
+        if self.search_queue == "radix" and heuristic != "manhattan":
+            return self.search_route_radix(s, t, hour, heuristic).time
         # We model the road network as a weighted graph where the edge weights are travel times
         # return the minimum shortest path for minimum time to go from s to t
         pq, dist = [(0, s)], defaultdict(lambda: float("inf"))
@@ -217,123 +422,342 @@ class RoadNetwork:
 
         return dist[t]
     
-    def add_traffic(self, path, hour):
-        for u, v in path:
-            if hour not in self.traffic:
-                self.traffic[hour] = {}
-            self.traffic[hour][(u, v)] = self.traffic[hour].get((u, v), 0) + 1
+    # Put one more driver on every edge of path until the simulated time `until`
+    def add_traffic(self, path, hour, until):
+        self.traffic.add(path, hour, until)
+
+    # Take drivers that have already driven through their routes off the road
+    def release_traffic(self, now):
+        self.traffic.release(now)
 
     # This method computes the shortest time needed for the driver to reach including traffic.
-    # a passenger at some (lat, lon) coord. Default implementation is A* with a euclidean heuristic
+    # a passenger at some (lat, lon) coord. Default implementation is A* with a euclidean heuristic.
+    # Returns the time and the path as the list of edge indices from s to t
     def get_time_with_traffic(self, s, t, hour, heuristic="euclidean"):
+        route = self.get_route(s, t, hour, heuristic=heuristic, traffic=True)
+        return route.time, list(route.edges)
+
+    # Same search as get_time but returns the whole Route (nodes, edges and cumulative
+    # times). Routes without traffic only depend on (s, t, hour, heuristic), so they are
+    # cached; complete_ride drives every trip through here, so repeated trips reuse them
+    def get_route(self, s, t, hour, heuristic="euclidean", traffic=False):
+        if traffic:
+            return self.search_route(s, t, hour, heuristic, self.traffic.get_multiplier(hour))
+        route = self.route_cache.get(s, t, hour, heuristic)
+        if route is None:
+            route = self.search_route(s, t, hour, heuristic, None)
+            self.route_cache.put(s, t, hour, heuristic, route)
+        return route
+
+    # Customized overlay (see crp.py) for the hour, with B3's traffic if asked. Traffic
+    # overlays re-customize only the cells whose edges changed since the last call
+    def get_overlay(self, hour, traffic=False):
+        if self.partition is None:
+            self.partition = Partition(self)
+        overlay = self.overlays.get((hour, traffic))
+        if overlay is None:
+            if traffic:
+                # The new overlay already sees the current multipliers
+                self.traffic.take_changes(hour)
+            overlay = self.overlays[(hour, traffic)] = Overlay(self.partition, hour, traffic)
+        elif traffic:
+            changes = self.traffic.take_changes(hour)
+            if changes:
+                overlay.update(changes)
+        return overlay
+
+    # Shortest time from s to t through the overlay; same result as get_route(...).time
+    def get_time_overlay(self, s, t, hour, traffic=False):
+        return self.get_overlay(hour, traffic).distance(s, t)
+
+    def get_jit_search(self):
+        if self.jit_search is None:
+            self.jit_search = JitSearch(self)
+        return self.jit_search
+
+    def get_hub_labels(self):
+        if self.hub_labels is None:
+            self.hub_labels = HubLabels(self)
+        return self.hub_labels
+
+    # Raises if SciPy is not installed
+    def get_scipy_backend(self):
+        if self.scipy_backend is None:
+            self.scipy_backend = ScipyBackend(self)
+        return self.scipy_backend
+
+    # Driving times between every source and every target node as a float32 array with
+    # one row per source (see travel_matrix.travel_time_matrix for the strategies)
+    def travel_time_matrix(self, sources, targets, hour, strategy="auto", processes=None):
+        return travel_time_matrix(self, sources, targets, hour, strategy, processes)
+
+    # A* over the compact edge list; edge times and traffic multipliers are plain array reads
+    def search_route(self, s, t, hour, heuristic="euclidean", multiplier=None):
+        if self.search_queue == "radix" and heuristic != "manhattan":
+            return self.search_route_radix(s, t, hour, heuristic, multiplier)
+
+        first_edge, edge_head, edge_time = self.first_edge, self.edge_head, self.edge_time[hour]
+        node_lat, node_lon = self.node_lat, self.node_lon
+        t_lat, t_lon = node_lat[t], node_lon[t]
 
         # We model the road network as a weighted graph where the edge weights are travel times
         # return the minimum shortest path for minimum time to go from s to t
-        pq, dist, prev = [(0, s)], defaultdict(lambda: float("inf")), {}
-        dist[s] = 0
-        prev[s] = None
+        pq, dist, prev = [(0, s)], {s: 0}, {s: None}
 
         while pq:
             cost, u = heapq.heappop(pq)
             if u == t:
                 break  # Stop when the target is reached
             # Add all neighbors to the search queue
-            for v in self.graph[u]:
-                curr_path = self.get_edge_data(u, v, hour, "time")
-
-                if hour in self.traffic and (u, v) in self.traffic[hour]:
-                    curr_path *= self.traffic[hour][(u, v)]
-                    
+            for e in range(first_edge[u], first_edge[u + 1]):
+                v = edge_head[e]
+                curr_path = edge_time[e] if multiplier is None else edge_time[e] * multiplier[e]
                 new_dist = dist[u] + curr_path
                 # We can still relax this edge
-                if dist[v] > new_dist:
+                if new_dist < dist.get(v, float("inf")):
                     dist[v] = new_dist
-                    prev[v] = u  # Store the predecessor
+                    prev[v] = e  # Store the edge we came in on
                     if heuristic == "euclidean":
                         # Note that h is the euclidean distance
-                        v_cost = dist[v] + self.get_distance(t, 
-                                                            self.node_to_latlon[v]["lat"],
-                                                            self.node_to_latlon[v]["lon"]) /  self.speed_limit
+                        v_cost = new_dist + math.sqrt((t_lat - node_lat[v]) ** 2 + (t_lon - node_lon[v]) ** 2) / self.speed_limit
                     elif heuristic == "djikstras":
-                        v_cost = dist[v]
+                        v_cost = new_dist
                     elif heuristic == "manhattan":
-                        v_cost = dist[v] + abs(self.node_to_latlon[t]["lat"] -
-                                            self.node_to_latlon[v]["lat"]) + abs(self.node_to_latlon[t]["lon"] - self.node_to_latlon[v]["lon"]) / self.speed_limit
+                        v_cost = new_dist + abs(t_lat - node_lat[v]) + abs(t_lon - node_lon[v]) / self.speed_limit
                     heapq.heappush(pq, (v_cost, v))
 
-        path = []
+        if t not in dist:
+            return NO_ROUTE
+        return self.build_route(t, dist, prev)
+
+    # search_route over a RadixHeap keyed by whole seconds instead of a binary heap of
+    # floats, for Dijkstra or A* with the (consistent) euclidean heuristic. Keys only
+    # order the search: times stay exact, so a node whose time improves after it was
+    # expanded (possible within the same second) is expanded again, and the search
+    # stops once every key up to t's time has been popped. Returns the same times as
+    # search_route, though equally fast routes may come out differently
+    def search_route_radix(self, s, t, hour, heuristic="euclidean", multiplier=None):
+        first_edge, edge_head, edge_time = self.first_edge, self.edge_head, self.edge_time[hour]
+        node_lat, node_lon = self.node_lat, self.node_lon
+        t_lat, t_lon = node_lat[t], node_lon[t]
+
+        pq, dist, prev, expanded = RadixHeap(), {s: 0}, {s: None}, {}
+        push, pop = pq.push, pq.pop
+        push((0, s))
+        while pq:
+            key, u = pop()
+            # No key left can lead to a faster arrival at t
+            if t in dist and key > dist[t] * 3600:
+                break
+            cost = dist[u]
+            if expanded.get(u) == cost:
+                continue
+            expanded[u] = cost
+            for e in range(first_edge[u], first_edge[u + 1]):
+                v = edge_head[e]
+                new_dist = cost + (edge_time[e] if multiplier is None else edge_time[e] * multiplier[e])
+                if new_dist < dist.get(v, float("inf")):
+                    dist[v] = new_dist
+                    prev[v] = e
+                    if heuristic == "euclidean":
+                        new_dist += math.sqrt((t_lat - node_lat[v]) ** 2 + (t_lon - node_lon[v]) ** 2) / self.speed_limit
+                    push((to_key(new_dist), v))
+
+        if t not in dist:
+            return NO_ROUTE
+        return self.build_route(t, dist, prev)
+
+    # Walk the predecessor edges back from t into a Route; dist gives the time offsets
+    def build_route(self, t, dist, prev):
+        nodes, edges = array("i", [t]), array("i")
         u = t
         while prev[u] is not None:
-            path.append((prev[u], u))
-            u = prev[u]
+            edges.append(prev[u])
+            u = self.tail_of(prev[u])
+            nodes.append(u)
+        nodes.reverse()
+        edges.reverse()
+        return Route(nodes, edges, array("d", [dist[u] for u in nodes]))
+
+    # Snap a coordinate onto the closest road segment; returns (edge, fraction along the edge, distance).
+    # The R-tree over the segments is only built the first time it is needed
+    def get_closest_segment(self, lat, lon):
+        if self.segment_index is None:
+            self.segment_index = EdgeRTree(self)
+        return self.segment_index.nearest(lat, lon)
+
+    # Edge going the other way along edge e, or None for a one-way road
+    def reverse_edge(self, e):
+        u, v = self.tail_of(e), self.edge_head[e]
+        for r in range(self.first_edge[v], self.first_edge[v + 1]):
+            if self.edge_head[r] == u:
+                return r
+        return None
+
+    # Variant of get_time between points part way along edges: source and target are
+    # (edge, fraction) pairs such as the ones returned by get_closest_segment. The
+    # search starts from both ends of the source road (each reached by driving the
+    # rest of the road, if it is two-way) and ends as soon as no better arrival
+    # at the target point is possible
+    def get_time_on_edges(self, source, target, hour):
+        first_edge, edge_head, edge_time = self.first_edge, self.edge_head, self.edge_time[hour]
+        (e_s, f), (e_t, g) = source, target
+        r_s, r_t = self.reverse_edge(e_s), self.reverse_edge(e_t)
+
+        # Both points on the same road, driving straight from one to the other (the source
+        # point is 1 - f along the reverse road r_s, the target point 1 - g along r_t)
+        best = float("inf")
+        if e_t == e_s:
+            if g >= f:
+                best = (g - f) * edge_time[e_s]
+            elif r_s is not None:
+                best = (f - g) * edge_time[r_s]
+        elif e_t == r_s:
+            if 1 - g >= f:
+                best = (1 - g - f) * edge_time[e_s]
+            else:
+                best = (g - (1 - f)) * edge_time[r_s]
+
+        # Where the search starts, and what is left to drive from each end of the target road
+        pq, dist = [], {}
+        for node, cost in ((edge_head[e_s], (1 - f) * edge_time[e_s]),
+                           (self.tail_of(e_s), None if r_s is None else f * edge_time[r_s])):
+            if cost is not None and cost < dist.get(node, float("inf")):
+                dist[node] = cost
+                heapq.heappush(pq, (cost, node))
+        remaining = {self.tail_of(e_t): g * edge_time[e_t]}
+        if r_t is not None:
+            remaining[edge_head[e_t]] = min(remaining.get(edge_head[e_t], float("inf")), (1 - g) * edge_time[r_t])
+
+        while pq:
+            cost, u = heapq.heappop(pq)
+            if cost >= best:
+                break
+            if cost > dist[u]:
+                continue
+            if u in remaining:
+                best = min(best, cost + remaining[u])
+            for e in range(first_edge[u], first_edge[u + 1]):
+                v = edge_head[e]
+                new_dist = cost + edge_time[e]
+                if new_dist < dist.get(v, float("inf")):
+                    dist[v] = new_dist
+                    heapq.heappush(pq, (new_dist, v))
+
+        return best
+
+    # Incoming edges in CSR form, for searches that run backwards: the edges into node v
+    # are reverse_edge_ids[reverse_first_edge[v]:reverse_first_edge[v + 1]] (ids in the
+    # forward edge list, so their times come from the usual arrays) and start at the
+    # matching entries of reverse_edge_tails
+    def reverse_edge_list(self):
+        if self.reverse_first_edge is None:
+            n = len(self.first_edge) - 1
+            counts = array("i", bytes(4 * (n + 1)))
+            for v in self.edge_head:
+                counts[v + 1] += 1
+            for v in range(n):
+                counts[v + 1] += counts[v]
+            slots = array("i", counts)
+            self.reverse_edge_ids = array("i", bytes(4 * len(self.edge_head)))
+            self.reverse_edge_tails = array("i", bytes(4 * len(self.edge_head)))
+            for u in range(n):
+                for e in range(self.first_edge[u], self.first_edge[u + 1]):
+                    v = self.edge_head[e]
+                    self.reverse_edge_ids[slots[v]] = e
+                    self.reverse_edge_tails[slots[v]] = u
+                    slots[v] += 1
+            self.reverse_first_edge = counts
+        return self.reverse_first_edge, self.reverse_edge_ids, self.reverse_edge_tails
+
+    # Source node index of edge e in the compact edge list
+    def tail_of(self, e):
+        return bisect.bisect_right(self.first_edge, e) - 1
+
+# Bidirectional map between the string node IDs used in the data files and the
+# small ints used everywhere inside the simulation
+class NodeIds:
+
+    def __init__(self):
+        self.ids = []
+        self.index = {}
+
+    # Returns the int for node_id, assigning the next free one if it is new
+    def intern(self, node_id):
+        i = self.index.get(node_id)
+        if i is None:
+            i = self.index[node_id] = len(self.ids)
+            self.ids.append(node_id)
+        return i
+
+    # Returns the int for node_id, or None if the node is not in the network
+    def lookup(self, node_id):
+        return self.index.get(node_id)
+
+    def __getitem__(self, i):
+        return self.ids[i]
 
-        return dist[t], path  # Return the distance and the path
+    def __len__(self):
+        return len(self.ids)
 
 # Read and parse adjacency.json as an adjacency list
-def read_adjacency(path):
+def read_adjacency(path, node_ids):
     graph = defaultdict(list)
     edge_data = defaultdict(lambda: defaultdict(dict))
     max_speed = float("-inf")
     with open(path, "r") as file:
         data = json.load(file)
         for start_node_id, end_node_datum in data.items():
+            start_node = node_ids.intern(start_node_id)
             for end_node_id, end_node_data in end_node_datum.items():
+                end_node = node_ids.intern(end_node_id)
                 # Build adjacency matrix view of graph edges
-                graph[start_node_id].append(end_node_id)
+                graph[start_node].append(end_node)
                 # Build lookup table for edge data/weights
                 for hour_of_the_day_data in end_node_data:
                     max_speed = max(max_speed, hour_of_the_day_data["max_speed"])
                     hour = hour_of_the_day_data["hour"]
-                    edge_data[(start_node_id, end_node_id)][hour] = hour_of_the_day_data
+                    edge_data[(start_node, end_node)][hour] = hour_of_the_day_data
     print("Completed reading adjacency.json")
     return graph, edge_data, max_speed
 
 # Read and parse node_data.json as a lookup table
-def read_node_data(path):
+def read_node_data(path, node_ids):
     node_data = defaultdict(dict)
     with open(path, "r") as file:
         data = json.load(file)
         for id, lat_lon in data.items():
             # Each node's data comes in the form of id: {lon: ..., lat: ...}
-            node_data[id] = lat_lon
+            node_data[node_ids.intern(id)] = lat_lon
     return node_data
 
-# Read drivers.csv as a lookup table
+# Read drivers.csv into a Fleet indexed by driver id
 def read_drivers(path):
-    drivers = defaultdict(dict)
+    drivers = Fleet()
     # Read and parse the drivers.csv file
     with open(path, "r") as file:
-        # Dummy variable for indexing the lookup table
-        index = 0
         for line in file:
             if not line.startswith("Date/Time"):
                 data = line.strip().split(",")
-                date_time = datetime.strptime(data[0], "%m/%d/%Y %H:%M:%S")
+                date_time = to_epoch(datetime.strptime(data[0], "%m/%d/%Y %H:%M:%S"))
                 source_lat = float(data[1])
                 source_lon = float(data[2])
                 # Compute a random driver capacity from around 10-12 rides
-                drivers[index] = {"time": date_time, "rides": random.randint(10, 12),
-                                  "source_lat": source_lat, "source_lon": source_lon}
-                index += 1
+                drivers.add(date_time, random.randint(10, 12), source_lat, source_lon)
     return drivers
 
-# Read passengers.csv as a lookup table
+# Read passengers.csv into a list of Passenger records indexed by passenger id
 def read_passengers(path):
-    passengers = defaultdict(dict)
+    passengers = []
     # Read and parse the passengers.csv file
     with open(path, "r") as file:
-        # Dummy variable for indexing the lookup table
-        index = 0
         for line in file:
             if not line.startswith("Date/Time"):
                 data = line.strip().split(",")
-                date_time = datetime.strptime(data[0], "%m/%d/%Y %H:%M:%S")
+                date_time = to_epoch(datetime.strptime(data[0], "%m/%d/%Y %H:%M:%S"))
                 source_lat = float(data[1])
                 source_lon = float(data[2])
                 dest_lat = float(data[3])
                 dest_lon = float(data[4])
-                passengers[index] = {"time": date_time,
-                                     "source_lat": source_lat, "source_lon": source_lon,
-                                     "dest_lat": dest_lat, "dest_lon": dest_lon}
-                index += 1
+                passengers.append(Passenger(date_time, source_lat, source_lon, dest_lat, dest_lon))
     return passengers